@@ -129,9 +129,142 @@ STATIC_URL = "/static/"
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
+# collectstatic target for the web server; files with a version in their name
+# (e.g. js/plotly-2.11.1.min.js) can be served with far-future cache headers
+STATIC_ROOT = env("STATIC_ROOT", default=os.path.join(BASE_DIR, "staticfiles"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# peak amplitude indexes for top N requests, built by manage.py build_peak_index
+PEAK_INDEX_ROOT = env(
+    "PEAK_INDEX_ROOT", default=os.path.join(MEDIA_ROOT, "atlas", "peak_index")
+)
+
+# number of stimulus waveforms kept in memory by each process
+STIMULUS_CACHE_SIZE = env.int("STIMULUS_CACHE_SIZE", default=64)
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# simulation results are cached by a hash of the parameters and the atlas version; the default
+# backend is a per-process LRU cache with a byte budget, set SIMULATION_CACHE_BACKEND to e.g.
+# django.core.cache.backends.filebased.FileBasedCache or .db.DatabaseCache (after running
+# manage.py createcachetable) to share results between processes
+SIMULATION_CACHE_BACKEND = env(
+    "SIMULATION_CACHE_BACKEND",
+    default="neuronsimulator.cache.ByteBudgetLocMemCache",
+)
+SIMULATION_CACHE_OPTIONS = {
+    "MAX_ENTRIES": env.int("SIMULATION_CACHE_MAX_ENTRIES", default=10000),
+}
+if SIMULATION_CACHE_BACKEND == "neuronsimulator.cache.ByteBudgetLocMemCache":
+    SIMULATION_CACHE_OPTIONS["MAX_BYTES"] = env.int(
+        "SIMULATION_CACHE_MAX_BYTES", default=256 * 2**20
+    )
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "simulation_results": {
+        "BACKEND": SIMULATION_CACHE_BACKEND,
+        "LOCATION": env("SIMULATION_CACHE_LOCATION", default="simulation-results"),
+        "TIMEOUT": None,
+        "OPTIONS": SIMULATION_CACHE_OPTIONS,
+    },
+}
+
+# Also store simulation results in the database (SimulationResult), where they are shared by
+# all processes and kept across restarts; looked up when the simulation cache misses
+SIMULATION_RESULT_STORE = env.bool("SIMULATION_RESULT_STORE", default=False)
+# least recently used results are deleted beyond this number of results or total size of the
+# compressed responses (bytes), 0 for no limit; see also manage.py prune_results
+SIMULATION_RESULT_STORE_MAX_ROWS = env.int(
+    "SIMULATION_RESULT_STORE_MAX_ROWS", default=10000
+)
+SIMULATION_RESULT_STORE_MAX_BYTES = env.int(
+    "SIMULATION_RESULT_STORE_MAX_BYTES", default=2**30
+)
+
+# Load the atlas of every strain when the app starts, so that a preloading server
+# (e.g. gunicorn --preload) shares the atlas memory between its forked workers
+PRELOAD_ATLASES = env.bool("PRELOAD_ATLASES", default=False)
+
+# Cache-Control max-age (seconds) of the neuron list endpoint
+NEURON_LIST_MAX_AGE = env.int("NEURON_LIST_MAX_AGE", default=3600)
+
+# Traces with more samples are decimated (min/max per bucket) before the plot is built,
+# 2 samples per pixel of the 1200 px wide plot keep every peak visible; 0 to send all samples
+PLOT_MAX_POINTS_PER_TRACE = env.int("PLOT_MAX_POINTS_PER_TRACE", default=2400)
+
+# Cache-Control max-age (seconds) of plot pages (home with url_for_plot parameters) in the
+# browser, which also validates them with an ETag; the pages embed the user's CSRF token, so
+# they are private to the browser, never stored by shared caches
+PLOT_PAGE_MAX_AGE = env.int("PLOT_PAGE_MAX_AGE", default=300)
+
+# maximum number of simulations in one request to the batch simulation endpoint
+SIMULATE_BATCH_MAX_SIZE = env.int("SIMULATE_BATCH_MAX_SIZE", default=500)
+
+# Serve the home page with an async view that runs simulations in a bounded pool (use with
+# an ASGI server, see config/asgi.py)
+ASYNC_SIMULATION = env.bool("ASYNC_SIMULATION", default=False)
+# pool of the async view: "thread" or "process" workers
+SIMULATION_EXECUTOR = env("SIMULATION_EXECUTOR", default="thread")
+SIMULATION_MAX_WORKERS = env.int("SIMULATION_MAX_WORKERS", default=os.cpu_count() or 1)
+# start method of the worker processes (simulation pool, job queue and warm_cache): server
+# processes run threads, and fork can copy locks held by other threads (e.g. logging) into
+# the children, so "spawn" (or "forkserver") is the default
+SIMULATION_START_METHOD = env("SIMULATION_START_METHOD", default="spawn")
+# simulations running or queued in the pool beyond which requests get a 503 response
+SIMULATION_MAX_PENDING = env.int(
+    "SIMULATION_MAX_PENDING", default=4 * SIMULATION_MAX_WORKERS
+)
+# Retry-After (seconds) of the 503 response
+SIMULATION_RETRY_AFTER = env.int("SIMULATION_RETRY_AFTER", default=5)
+
+# Run home page simulations as background jobs (otherwise only with job=1): the page polls the
+# job and shows the plot once done, so that long simulations do not hit proxy timeouts; pages
+# without a stimulated neuron or with a cached output are rendered directly
+SIMULATION_JOBS = env.bool("SIMULATION_JOBS", default=False)
+# worker processes of the job queue
+SIMULATION_JOB_WORKERS = env.int("SIMULATION_JOB_WORKERS", default=2)
+# jobs pending for longer (seconds) are reported as failed
+SIMULATION_JOB_TIMEOUT = env.int("SIMULATION_JOB_TIMEOUT", default=3600)
+# refresh interval (seconds) of the page of a pending job
+SIMULATION_JOB_REFRESH = env.int("SIMULATION_JOB_REFRESH", default=2)
+
+# Bearer token of the scrapers of the /metrics endpoint (Authorization: Bearer <token>), the
+# endpoint is disabled without one; behind a reverse proxy every request comes from the proxy,
+# so the peer address can not tell scrapers from visitors
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
+# Profiles of staff requests with profile=1 (see profiling.py), and the number of functions
+# in their reports
+PROFILE_ROOT = env("PROFILE_ROOT", default=os.path.join(MEDIA_ROOT, "profiles"))
+PROFILE_TOP_N = env.int("PROFILE_TOP_N", default=40)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "neuronsimulator": {
+            "handlers": ["console"],
+            "level": env("NEURONSIMULATOR_LOG_LEVEL", default="INFO"),
+        },
+        # one JSON line with the stage timings of each request, set WARNING to turn off
+        "neuronsimulator.timing": {
+            "handlers": ["console"],
+            "level": env("STAGE_TIMING_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+    },
+}
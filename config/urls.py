@@ -14,12 +14,18 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from neuronsimulator import views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("", views.home, name="home"),
+    path(
+        "",
+        views.home_async if settings.ASYNC_SIMULATION else views.home,
+        name="home",
+    ),
+    path("metrics", views.metrics, name="metrics"),
     path("neuronsimulator/", include("neuronsimulator.urls")),
 ]
@@ -1,7 +1,79 @@
+import logging
+import os
+import resource
+import time
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+
+logger = logging.getLogger(__name__)
+
+
+def get_resident_size():
+    """
+    get the resident set size of the current process in bytes
+    /proc is used where available, otherwise fall back to the peak size reported by getrusage
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fail_orphaned_jobs_once(sender, **kwargs):
+    """
+    mark the simulation jobs left pending by a restarted server process as failed, once
+    per process
+    """
+    from neuronsimulator.jobs import fail_orphaned_jobs
+
+    request_started.disconnect(dispatch_uid="fail_orphaned_jobs_once")
+    fail_orphaned_jobs()
 
 
 class NeuronSimulatorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "neuronsimulator"
     verbose_name = "Neuron Simulator"
+
+    def ready(self):
+        """
+        optionally load the atlas of every strain at startup (settings.PRELOAD_ATLASES)
+        with a preloading server (e.g. gunicorn --preload) this happens before workers are forked,
+        so all workers share the atlas pages copy-on-write instead of each loading a private copy
+        """
+        if getattr(settings, "PRELOAD_ATLASES", False):
+            self.preload_atlases()
+        # the database is not queried while the apps are loading, but at the first request
+        request_started.connect(
+            fail_orphaned_jobs_once, dispatch_uid="fail_orphaned_jobs_once"
+        )
+
+    def preload_atlases(self):
+        # imported here so that the app registry is ready before wormfunconn is loaded
+        import wormfunconn as wfc
+        from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+        for strain_type in wfc.strains:
+            rss_before = get_resident_size()
+            start = time.perf_counter()
+            funatlas, app_error_dict = wfc2plot().get_funatlas(strain_type)
+            elapsed = time.perf_counter() - start
+            if funatlas is None:
+                logger.warning(
+                    "Atlas for strain %s was not preloaded: %s",
+                    strain_type,
+                    app_error_dict,
+                )
+                continue
+            rss_after = get_resident_size()
+            logger.info(
+                "Preloaded atlas for strain %s in %.3f s, resident size +%.1f MB",
+                strain_type,
+                elapsed,
+                (rss_after - rss_before) / 2**20,
+            )
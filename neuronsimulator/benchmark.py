@@ -0,0 +1,233 @@
+import json
+import platform
+import statistics
+import time
+
+import numpy as np
+import plotly
+from django.conf import settings
+from neuronsimulator.utils import AtlasRegistry
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+from neuronsimulator.utils import stimulus_cache
+from plotly.offline import plot
+from wormfunconn import FunctionalAtlas
+
+# atlas of the benchmark, small enough to run anywhere
+BENCHMARK_ATLAS = "mock.pickle"
+# how the atlas is loaded in the atlas_load stage: from the "pickle" or from its memory-mapped
+# "layout" (manage.py convert_atlas), never chosen by what happens to exist on disk
+ATLAS_FORMATS = ["pickle", "layout"]
+
+# stages of get_all_output_for_plot, in pipeline order
+STAGES = [
+    "atlas_load",
+    "param_filtering",
+    "stimulus",
+    "get_responses",
+    "figure_build",
+    "plot_serialization",
+    "snippet",
+]
+
+# default sweep
+DEFAULT_NT = [1000, 10000]
+DEFAULT_N_RESP = [1, 10, 50]
+DEFAULT_TOP_N = [10, 50]
+
+# a stage only regresses if it is slower than the baseline by the tolerance and this margin,
+# so that sub-millisecond stages do not fail on timer noise
+NOISE_FLOOR_MS = 1.0
+
+
+def get_cases(nt_list, n_resp_list, top_n_list):
+    """
+    get the sweep of benchmark cases: every nt with each number of response neurons, and with
+    each top_n (response neurons chosen by the atlas)
+    """
+    cases = []
+    for nt in nt_list:
+        for n_resp in n_resp_list:
+            cases.append(
+                {"name": f"nt={nt},n_resp={n_resp}", "nt": nt, "n_resp": n_resp}
+            )
+        for top_n in top_n_list:
+            cases.append({"name": f"nt={nt},top_n={top_n}", "nt": nt, "top_n": top_n})
+    return cases
+
+
+def get_case_params(case, stim_neu_id, neuron_ids):
+    """
+    get the ParamForm parameters of a benchmark case, with dt the same for all nt
+    """
+    n_resp = case.get("n_resp")
+    return {
+        "strain_type": "wild-type",
+        "stim_type": "rectangular",
+        "stim_neu_id": stim_neu_id,
+        "resp_neu_ids": neuron_ids[:n_resp] if n_resp else [],
+        "top_n": case.get("top_n"),
+        "nt": case["nt"],
+        "t_max": case["nt"] * 0.1,
+        "duration": 1.0,
+    }
+
+
+def time_stage(timings, stage, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings[stage] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def load_benchmark_atlas(folder, fname, atlas_format):
+    """
+    load the benchmark atlas from its pickle or its memory-mapped layout, without the registry
+    """
+    if atlas_format == "layout":
+        layout_dir = AtlasRegistry.get_layout_dir(folder, fname)
+        if AtlasRegistry.read_layout_manifest(layout_dir) is None:
+            raise ValueError(
+                f"No memory-mapped layout in {layout_dir}, run 'manage.py convert_atlas "
+                f"{fname}'"
+            )
+        return AtlasRegistry.load_atlas_layout(layout_dir)
+    return FunctionalAtlas.from_file(folder, fname)
+
+
+def run_case_once(folder, fname, params, atlas_format="pickle"):
+    """
+    run every stage of get_all_output_for_plot once, without the stimulus, result and plot
+    caches; the responses are computed by get_responses directly, so the peak amplitude
+    index (built for the real atlases) is not used
+    return the time of each stage in milliseconds
+    """
+    timings = {}
+    w2p = wfc2plot()
+    funatlas = time_stage(
+        timings, "atlas_load", load_benchmark_atlas, folder, fname, atlas_format
+    )
+    reqd_params_dict, app_error_dict = time_stage(
+        timings, "param_filtering", w2p.get_reqd_params_dict, params
+    )
+    stimulus_cache.clear()
+    stim, app_error_dict = time_stage(
+        timings, "stimulus", w2p.get_stimulus, funatlas, reqd_params_dict
+    )
+    if app_error_dict:
+        raise ValueError(f"{params}: {app_error_dict}")
+    resp_neu_ids, top_n = w2p.get_resp_kwargs(reqd_params_dict)
+    resp, labels, confidences, msg = time_stage(
+        timings,
+        "get_responses",
+        lambda: funatlas.get_responses(
+            stim,
+            w2p.t_max_to_dt(float(params["t_max"]), int(params["nt"])),
+            params["stim_neu_id"],
+            resp_neu_ids=resp_neu_ids,
+            threshold=0.0,
+            top_n=top_n,
+        ),
+    )
+    figure = time_stage(
+        timings,
+        "figure_build",
+        w2p.get_plot_figure,
+        reqd_params_dict,
+        resp,
+        labels,
+        confidences,
+    )
+    time_stage(
+        timings,
+        "plot_serialization",
+        lambda: plot(figure, output_type="div", include_plotlyjs=False),
+    )
+    time_stage(
+        timings,
+        "snippet",
+        lambda: (
+            w2p.get_url_query_string_for_plot(reqd_params_dict),
+            w2p.get_code_snippet_for_plot(reqd_params_dict),
+        ),
+    )
+    return timings
+
+
+def run_benchmark(
+    nt_list=DEFAULT_NT,
+    n_resp_list=DEFAULT_N_RESP,
+    top_n_list=DEFAULT_TOP_N,
+    repeat=5,
+    fname=BENCHMARK_ATLAS,
+    atlas_format="pickle",
+):
+    """
+    time the stages of each case of the sweep repeat times
+    return the results as a JSON-serializable dict, with the min and median time of each stage
+    """
+    folder = wfc2plot.get_atlas_folder()
+    funatlas = load_benchmark_atlas(folder, fname, atlas_format)
+    neuron_ids = [str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=False)]
+    stim_neu_id = str(funatlas.get_neuron_ids(stim=True)[0])
+
+    results = {
+        "atlas": fname,
+        "atlas_format": atlas_format,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plotly": plotly.__version__,
+        "plot_max_points_per_trace": settings.PLOT_MAX_POINTS_PER_TRACE,
+        "cases": {},
+    }
+    for case in get_cases(nt_list, n_resp_list, top_n_list):
+        params = get_case_params(case, stim_neu_id, neuron_ids)
+        runs = [
+            run_case_once(folder, fname, params, atlas_format) for _ in range(repeat)
+        ]
+        results["cases"][case["name"]] = {
+            stage: {
+                "min_ms": round(min(run[stage] for run in runs), 3),
+                "median_ms": round(statistics.median(run[stage] for run in runs), 3),
+            }
+            for stage in STAGES
+        }
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    get the stages of the cases in both results and baseline whose min time is more than
+    tolerance (e.g. 0.25 for 25%) and NOISE_FLOOR_MS slower than the baseline
+    """
+    regressions = []
+    for name, stages in results["cases"].items():
+        baseline_stages = baseline.get("cases", {}).get(name)
+        if baseline_stages is None:
+            continue
+        for stage, timing in stages.items():
+            if stage not in baseline_stages:
+                continue
+            baseline_ms = baseline_stages[stage]["min_ms"]
+            limit_ms = baseline_ms * (1 + tolerance) + NOISE_FLOOR_MS
+            if timing["min_ms"] > limit_ms:
+                regressions.append(
+                    {
+                        "case": name,
+                        "stage": stage,
+                        "min_ms": timing["min_ms"],
+                        "baseline_min_ms": baseline_ms,
+                    }
+                )
+    return regressions
+
+
+def read_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def write_results(results, path):
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+# alias in settings.CACHES of the cache for simulation results
+SIMULATION_CACHE_ALIAS = "simulation_results"
+
+# Global size bookkeeping, keyed by cache name like the storage of LocMemCache
+_sizes = {}
+_usage = {}
+
+
+def get_simulation_cache():
+    return caches[SIMULATION_CACHE_ALIAS]
+
+
+class ByteBudgetLocMemCache(LocMemCache):
+    """
+    local-memory cache with LRU eviction bounded by the total size of the stored (pickled)
+    values as well as by the number of entries
+    OPTIONS:
+        MAX_BYTES: byte budget for all values, 0 or missing for no budget
+        MAX_ENTRIES/CULL_FREQUENCY: same as for LocMemCache
+    values larger than the whole budget are not stored
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        options = params.get("OPTIONS", {})
+        self._max_bytes = int(options.get("MAX_BYTES", 0) or 0)
+        self._sizes = _sizes.setdefault(name, {})
+        self._usage = _usage.setdefault(name, {"bytes": 0, "evictions": 0})
+
+    @property
+    def total_bytes(self):
+        return self._usage["bytes"]
+
+    @property
+    def evictions(self):
+        return self._usage["evictions"]
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._delete(key)
+        if self._max_bytes and len(value) > self._max_bytes:
+            return
+        super()._set(key, value, timeout)
+        self._sizes[key] = len(value)
+        self._usage["bytes"] += len(value)
+        # the most recently used entry is first, evict from the end
+        while self._max_bytes and self._usage["bytes"] > self._max_bytes:
+            self._evict_lru()
+
+    def incr(self, key, delta=1, version=None):
+        new_value = super().incr(key, delta=delta, version=version)
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            size = len(self._cache[key])
+            self._usage["bytes"] += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        return new_value
+
+    def _evict_lru(self):
+        key, _ = self._cache.popitem()
+        del self._expire_info[key]
+        self._usage["bytes"] -= self._sizes.pop(key, 0)
+        self._usage["evictions"] += 1
+
+    def _cull(self):
+        if self._cull_frequency == 0:
+            count = len(self._cache)
+        else:
+            count = len(self._cache) // self._cull_frequency
+        for i in range(count):
+            self._evict_lru()
+
+    def _delete(self, key):
+        deleted = super()._delete(key)
+        if deleted:
+            self._usage["bytes"] -= self._sizes.pop(key, 0)
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            self._sizes.clear()
+            self._usage["bytes"] = 0
+
+
+class StimulusCache:
+    """
+    bounded LRU memo of stimulus waveforms, keyed by the arguments of get_standard_stimulus
+    (which do not depend on the strain or the stimulated neuron)
+    the arrays are shared by all callers, so they are made read-only
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            stim = self._cache.get(key)
+            if stim is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return stim
+        # the waveform is built outside the lock, a concurrent miss only builds it twice
+        stim = create()
+        stim.setflags(write=False)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = stim
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return stim
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from neuronsimulator.metrics import POOL_TASKS_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+class SimulationPoolFull(Exception):
+    """
+    raised when settings.SIMULATION_MAX_PENDING simulations are already running or queued
+    """
+
+
+def init_worker_process():
+    """
+    set up django in a worker process; spawned workers start without django, and with fork
+    the database connections of the parent are inherited and must not be shared, so they
+    are closed
+    """
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def get_mp_context():
+    """
+    multiprocessing context of the worker processes, see settings.SIMULATION_START_METHOD
+    """
+    return multiprocessing.get_context(settings.SIMULATION_START_METHOD)
+
+
+def get_executor():
+    """
+    get the pool running simulations for the async views, created on first use
+    settings.SIMULATION_EXECUTOR: "thread" or "process"
+    settings.SIMULATION_MAX_WORKERS: number of threads or processes
+    """
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = settings.SIMULATION_MAX_WORKERS
+                if settings.SIMULATION_EXECUTOR == "process":
+                    executor = ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        mp_context=get_mp_context(),
+                        initializer=init_worker_process,
+                    )
+                else:
+                    executor = ThreadPoolExecutor(
+                        max_workers=max_workers, thread_name_prefix="simulation"
+                    )
+                _slots = threading.BoundedSemaphore(settings.SIMULATION_MAX_PENDING)
+                logger.info(
+                    "Started %s simulation pool with %d workers",
+                    settings.SIMULATION_EXECUTOR,
+                    max_workers,
+                )
+                _executor = executor
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+        _executor = None
+        _slots = None
+
+
+async def run_in_pool(func, *args):
+    """
+    run func(*args) in the simulation pool without blocking the event loop
+    func and args must be picklable for the process pool, i.e. module-level functions
+    raises SimulationPoolFull instead of queueing more than SIMULATION_MAX_PENDING calls
+    """
+    executor = get_executor()
+    slots = _slots
+    # a threading semaphore works with any event loop and across threads
+    if not slots.acquire(blocking=False):
+        raise SimulationPoolFull()
+    POOL_TASKS_IN_FLIGHT.inc(pool="async")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, func, *args)
+    finally:
+        POOL_TASKS_IN_FLIGHT.dec(pool="async")
+        slots.release()
+
+
+def get_all_output_for_plot(form_params):
+    """
+    module-level entry point of the simulation for the pool
+    in a process pool the atlases and the cache of simulation results are those of the
+    worker process
+    """
+    from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+    return wfc2plot().get_all_output_for_plot(form_params)
+
+
+def warm_output_for_plot(form_params):
+    """
+    entry point of the warm_cache command for the pool: fill the caches with the output of
+    get_all_output_for_plot and only return its errors, as strings
+    """
+    out = get_all_output_for_plot(form_params)
+    return {k: str(v) for k, v in out.app_error_dict.items()}
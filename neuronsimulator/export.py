@@ -0,0 +1,87 @@
+import csv
+import io
+import zipfile
+
+import numpy as np
+
+# time steps per chunk of the CSV export
+EXPORT_CHUNK_ROWS = 1024
+# bytes per chunk of the .npy and .npz exports
+EXPORT_CHUNK_BYTES = 2**20
+
+
+def iter_npy_bytes(arr, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """
+    yield arr as a .npy file: the header, then the data in C order, chunk_bytes at a time
+    (for responses, neurons x time steps, a chunk covers consecutive neurons whatever the
+    shape, so memory stays bounded for long simulations)
+    """
+    # ascontiguousarray would make 0-d arrays 1-d
+    arr = np.asarray(arr, order="C")
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header, np.lib.format.header_data_from_array_1_0(arr)
+    )
+    yield header.getvalue()
+    data = arr.reshape(-1).view(np.uint8)
+    for start in range(0, len(data), chunk_bytes):
+        end = start + chunk_bytes
+        yield data[start:end].tobytes()
+
+
+def iter_csv(resp, t, labels, confidences, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    yield the responses as CSV text: a header row "time" + labels, a "confidence" row, then
+    one row per time step
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["time"] + list(labels))
+    if confidences is not None:
+        writer.writerow(["confidence"] + [f"{c:.7g}" for c in confidences])
+    yield buffer.getvalue()
+    for start in range(0, len(t), chunk_rows):
+        end = start + chunk_rows
+        buffer = io.StringIO()
+        chunk = np.column_stack([t[start:end], resp[:, start:end].T])
+        np.savetxt(buffer, chunk, fmt="%.7g", delimiter=",")
+        yield buffer.getvalue()
+
+
+class StreamBuffer:
+    """
+    write-only file object that keeps the written bytes until they are taken by the
+    streaming response, zipfile writes to it as to an unseekable stream
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_npz(arrays, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """
+    yield an uncompressed .npz (as np.savez) of a dict of arrays, one chunk at a time
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for name, arr in arrays.items():
+            with zf.open(f"{name}.npy", mode="w", force_zip64=True) as npy_file:
+                for data in iter_npy_bytes(arr, chunk_bytes):
+                    npy_file.write(data)
+                    data = buffer.take()
+                    if data:
+                        yield data
+    # central directory
+    yield buffer.take()
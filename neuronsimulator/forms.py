@@ -1,8 +1,44 @@
+import threading
+from collections import namedtuple
+
 import wormfunconn as wfc
 from django import forms
 from django.core.validators import MinValueValidator
 from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
 
+# choices and attrs of the strain dependent fields of ParamForm
+FormSchema = namedtuple("FormSchema", "neuron_choices, top_n_max")
+
+_form_schemas = {}
+_form_schemas_lock = threading.Lock()
+
+
+def get_form_schema(strain_type):
+    """
+    get the FormSchema of a strain, built once per process from the strain's neuron ids
+    unknown strains get the wild-type schema (the form reports them as invalid)
+    """
+    if strain_type not in wfc.strains:
+        strain_type = "wild-type"
+    form_schema = _form_schemas.get(strain_type)
+    if form_schema is None:
+        neuron_ids, app_error_dict = wfc2plot().get_neuron_ids(strain_type)
+        form_schema = FormSchema(
+            neuron_choices=tuple((neu_id, neu_id) for neu_id in neuron_ids),
+            top_n_max=len(neuron_ids) - 1,
+        )
+        # a schema without neurons (e.g. missing atlas file) is not kept
+        if app_error_dict:
+            return form_schema
+        with _form_schemas_lock:
+            _form_schemas[strain_type] = form_schema
+    return form_schema
+
+
+def clear_form_schemas():
+    with _form_schemas_lock:
+        _form_schemas.clear()
+
 
 class ParamForm(forms.Form):
     """
@@ -30,8 +66,33 @@ class ParamForm(forms.Form):
         initial="realistic",
         widget=forms.Select,
     )
-    stim_neu_id = forms.ChoiceField()
-    resp_neu_ids = forms.MultipleChoiceField()
+    # choices of neuron fields are set per strain in __init__
+    stim_neu_id = forms.ChoiceField(
+        required=False,
+        label="Stimulated neuron",
+        widget=forms.Select(
+            attrs={
+                "class": "selectpicker",
+                "data-live-search": "true",
+                "data-width": "fit",
+                "title": "Choose one neuron",
+            }
+        ),
+    )
+    resp_neu_ids = forms.MultipleChoiceField(
+        label="Hand selected neurons",
+        required=False,
+        widget=forms.SelectMultiple(
+            attrs={
+                "class": "selectpicker",
+                "data-live-search": "true",
+                "data-width": "fit",
+                "data-actions-box": "true",
+                "data-selected-text-format": "count > 12",
+                "title": "Choose neurons a priori",
+            }
+        ),
+    )
     top_n = forms.IntegerField(
         initial=10,
         label="Top N most responsive",
@@ -60,55 +121,38 @@ class ParamForm(forms.Form):
     def __init__(self, *args, **kwargs):
 
         super().__init__(*args, **kwargs)
-        # set attrs. for optional fields:
-        for field_name, field_attrs in self.form_opt_field_dict.items():
-            self.fields[field_name].label = field_attrs["label"]
-            self.fields[field_name].initial = field_attrs["default"]
-            self.fields[field_name].help_text = field_attrs["help_text"]
-            self.fields[field_name].widget.attrs["min"] = field_attrs["min_val"]
-            self.fields[field_name].widget.attrs["max"] = field_attrs["max_val"]
-            self.fields[field_name].widget.attrs["step"] = field_attrs["step"]
-
-        # default choices for neurons
-        neuron_ids, app_error_dict = wfc2plot().get_neuron_ids("wild-type")
-        # set neuron choices based on strain type
+
+        # set neuron choices based on strain type, default choices are for wild-type
+        strain_type = "wild-type"
         if "strain_type" in self.data:
-            try:
-                strain_type = self.data.get("strain_type")
-                neuron_ids, app_error_dict = wfc2plot().get_neuron_ids(strain_type)
-            except (ValueError, TypeError):
-                neuron_ids, app_error_dict = wfc2plot().get_neuron_ids("wild-type")
-
-        neuron_choices = [(neu_id, neu_id) for neu_id in neuron_ids]
-
-        self.fields["stim_neu_id"] = forms.ChoiceField(
-            choices=neuron_choices,
-            required=False,
-            label="Stimulated neuron",
-            widget=forms.Select(
-                attrs={
-                    "class": "selectpicker",
-                    "data-live-search": "true",
-                    "data-width": "fit",
-                    "title": "Choose one neuron",
-                }
-            ),
-        )
+            strain_type = self.data.get("strain_type")
+        try:
+            form_schema = get_form_schema(strain_type)
+        except (ValueError, TypeError):
+            form_schema = get_form_schema("wild-type")
 
-        self.fields["resp_neu_ids"] = forms.MultipleChoiceField(
-            choices=neuron_choices,
-            label="Hand selected neurons",
-            required=False,
-            widget=forms.SelectMultiple(
-                attrs={
-                    "class": "selectpicker",
-                    "data-live-search": "true",
-                    "data-width": "fit",
-                    "data-actions-box": "true",
-                    "data-selected-text-format": "count > 12",
-                    "title": "Choose neurons a priori",
-                }
-            ),
-        )
+        self.fields["stim_neu_id"].choices = form_schema.neuron_choices
+        self.fields["resp_neu_ids"].choices = form_schema.neuron_choices
+        self.fields["top_n"].widget.attrs["max"] = form_schema.top_n_max
 
-        self.fields["top_n"].widget.attrs["max"] = len(neuron_ids) - 1
+
+# set attrs. for optional fields once, form instances get deep copies of base_fields
+for field_name, field_attrs in ParamForm.form_opt_field_dict.items():
+    field = ParamForm.base_fields[field_name]
+    field.label = field_attrs["label"]
+    field.initial = field_attrs["default"]
+    field.help_text = field_attrs["help_text"]
+    field.widget.attrs["min"] = field_attrs["min_val"]
+    field.widget.attrs["max"] = field_attrs["max_val"]
+    field.widget.attrs["step"] = field_attrs["step"]
+
+
+def get_form_init_dict():
+    """
+    get initial values for all form fields
+    """
+    form_init_dict = {}
+    my_form = ParamForm()
+    for k in my_form.fields.keys():
+        form_init_dict[k] = my_form[k].initial
+    return form_init_dict
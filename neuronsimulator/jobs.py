@@ -0,0 +1,188 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from neuronsimulator.executor import (
+    get_all_output_for_plot,
+    get_mp_context,
+    init_worker_process,
+)
+from neuronsimulator.metrics import POOL_TASKS_IN_FLIGHT
+from neuronsimulator.models import SimulationJob
+
+logger = logging.getLogger(__name__)
+
+ORPHANED_JOB_ERROR = "The server process running the simulation was restarted"
+
+_job_executor = None
+_job_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """
+    get the local process pool running the simulation jobs, created on first use
+    jobs need no broker: the pool belongs to the server process that got the request, and
+    the results are saved in the database, where any server process can read them
+    """
+    global _job_executor
+    if _job_executor is None:
+        with _job_executor_lock:
+            if _job_executor is None:
+                _job_executor = ProcessPoolExecutor(
+                    max_workers=settings.SIMULATION_JOB_WORKERS,
+                    mp_context=get_mp_context(),
+                    initializer=init_worker_process,
+                )
+    return _job_executor
+
+
+def shutdown_job_executor(wait=True):
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is not None:
+            _job_executor.shutdown(wait=wait)
+        _job_executor = None
+
+
+def output_to_result(out):
+    """
+    convert the AllOutput of get_all_output_for_plot to JSON-serializable values
+    """
+    result = out._asdict()
+    result["app_error_dict"] = {k: str(v) for k, v in out.app_error_dict.items()}
+    return result
+
+
+def save_job_result(job_id, future):
+    """
+    done-callback of a job's future, runs in a thread of the server process
+    """
+    try:
+        try:
+            result = output_to_result(future.result())
+        except Exception as e:
+            logger.exception("Simulation job %s failed", job_id)
+            SimulationJob.objects.filter(id=job_id).update(
+                status=SimulationJob.FAILED, error=str(e), updated=timezone.now()
+            )
+        else:
+            SimulationJob.objects.filter(id=job_id).update(
+                status=SimulationJob.DONE, result=result, updated=timezone.now()
+            )
+    finally:
+        POOL_TASKS_IN_FLIGHT.dec(pool="jobs")
+        # the callback thread is not managed by django's request handling
+        connection.close()
+
+
+def get_process_start_time(pid):
+    """
+    get the start time of a process (clock ticks after boot, from /proc), which tells a
+    process from a later one with the same pid; None if not available
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # the fields after the command name, which is in parentheses
+            fields = stat.read().rpartition(")")[2].split()
+        return fields[19]
+    except (OSError, IndexError):
+        return None
+
+
+def get_worker_id(pid=None):
+    """
+    identify the server process running a job, as "host:pid:start time"
+    """
+    pid = os.getpid() if pid is None else pid
+    return f"{socket.gethostname()}:{pid}:{get_process_start_time(pid) or ''}"
+
+
+def is_process_alive(pid, start_time):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        pass
+    # a pid reused by another process, e.g. after a container restart
+    return not start_time or get_process_start_time(pid) in (None, start_time)
+
+
+def is_orphaned(job):
+    """
+    whether a pending job was submitted by a process of this host that is gone, e.g.
+    because the server was restarted; the results of its pool are then never saved
+    """
+    host, pid, start_time = (job.worker.split(":") + ["", "", ""])[:3]
+    if job.status != SimulationJob.PENDING or not pid.isdigit():
+        return False
+    if host != socket.gethostname():
+        return False
+    return not is_process_alive(int(pid), start_time)
+
+
+def fail_orphaned_jobs():
+    """
+    mark the orphaned jobs of this host as failed, returns their number
+    """
+    try:
+        jobs = list(
+            SimulationJob.objects.filter(
+                status=SimulationJob.PENDING,
+                worker__startswith=socket.gethostname() + ":",
+            )
+        )
+        orphaned_ids = [job.id for job in jobs if is_orphaned(job)]
+        if orphaned_ids:
+            SimulationJob.objects.filter(id__in=orphaned_ids).update(
+                status=SimulationJob.FAILED,
+                error=ORPHANED_JOB_ERROR,
+                updated=timezone.now(),
+            )
+    except DatabaseError as e:
+        logger.warning("Could not check for orphaned simulation jobs: %s", e)
+        return 0
+    if orphaned_ids:
+        logger.warning(
+            "Marked %d orphaned simulation jobs as failed", len(orphaned_ids)
+        )
+    return len(orphaned_ids)
+
+
+def submit_job(form_params):
+    """
+    save a pending job and run get_all_output_for_plot(form_params) in the job pool
+    """
+    job = SimulationJob.objects.create(params=form_params, worker=get_worker_id())
+    POOL_TASKS_IN_FLIGHT.inc(pool="jobs")
+    future = get_job_executor().submit(get_all_output_for_plot, form_params)
+    future.add_done_callback(partial(save_job_result, job.id))
+    return job
+
+
+def expire_job(job):
+    """
+    mark a job as failed if its server process is gone (see is_orphaned) or if it stayed
+    pending longer than settings.SIMULATION_JOB_TIMEOUT, e.g. because it ran on another
+    host that was restarted; returns whether the job was expired
+    """
+    if job.status != SimulationJob.PENDING:
+        return False
+    timeout = timedelta(seconds=settings.SIMULATION_JOB_TIMEOUT)
+    if is_orphaned(job):
+        job.error = ORPHANED_JOB_ERROR
+    elif timezone.now() - job.created >= timeout:
+        job.error = "The simulation did not finish in time"
+    else:
+        return False
+    job.status = SimulationJob.FAILED
+    job.save(update_fields=["status", "error", "updated"])
+    return True
@@ -0,0 +1,113 @@
+import os
+
+from django.core.management import BaseCommand, CommandError
+from neuronsimulator.benchmark import (
+    ATLAS_FORMATS,
+    DEFAULT_N_RESP,
+    DEFAULT_NT,
+    DEFAULT_TOP_N,
+    STAGES,
+    compare_to_baseline,
+    read_results,
+    run_benchmark,
+    write_results,
+)
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Times each stage of the simulation request pipeline on the mock atlas for a sweep of "
+        "nt, response neurons and top_n, and fails if a stage is slower than the baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--nt", type=int, action="append", dest="nt_list", help="(repeatable)"
+        )
+        parser.add_argument(
+            "--n-resp",
+            type=int,
+            action="append",
+            dest="n_resp_list",
+            help="number of response neurons (repeatable)",
+        )
+        parser.add_argument(
+            "--top-n", type=int, action="append", dest="top_n_list", help="(repeatable)"
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--atlas-format",
+            choices=ATLAS_FORMATS,
+            default="pickle",
+            help="load the atlas from its pickle or its memory-mapped layout (default pickle)",
+        )
+        parser.add_argument("--output", help="write the results to this JSON file")
+        parser.add_argument(
+            "--baseline", help="JSON results of an earlier run to compare with"
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="allowed slowdown of each stage relative to the baseline (default 0.25)",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="write the results to the --baseline file instead of comparing",
+        )
+
+    def handle(self, *args, **options):
+        baseline_path = options["baseline"]
+        if options["save_baseline"] and not baseline_path:
+            raise CommandError("--save-baseline requires --baseline")
+        if baseline_path and not options["save_baseline"]:
+            if not os.path.isfile(baseline_path):
+                raise CommandError(
+                    f"No baseline {baseline_path}, create it with --save-baseline"
+                )
+
+        try:
+            results = run_benchmark(
+                nt_list=options["nt_list"] or DEFAULT_NT,
+                n_resp_list=options["n_resp_list"] or DEFAULT_N_RESP,
+                top_n_list=options["top_n_list"] or DEFAULT_TOP_N,
+                repeat=options["repeat"],
+                atlas_format=options["atlas_format"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name, stages in results["cases"].items():
+            timings = ", ".join(
+                f"{stage} {stages[stage]['min_ms']:.1f}" for stage in STAGES
+            )
+            self.stdout.write(f"{name}: {timings} (min ms)")
+        if options["output"]:
+            write_results(results, options["output"])
+        if not baseline_path:
+            return
+        if options["save_baseline"]:
+            write_results(results, baseline_path)
+            self.stdout.write(f"Saved baseline {baseline_path}")
+            return
+
+        baseline = read_results(baseline_path)
+        baseline_format = baseline.get("atlas_format", "pickle")
+        if baseline_format != results["atlas_format"]:
+            raise CommandError(
+                f"The baseline loaded the atlas from its {baseline_format}, run with "
+                f"--atlas-format {baseline_format}"
+            )
+        regressions = compare_to_baseline(results, baseline, options["tolerance"])
+        for regression in regressions:
+            self.stderr.write(
+                f"{regression['case']} {regression['stage']}: {regression['min_ms']:.1f} ms, "
+                f"baseline {regression['baseline_min_ms']:.1f} ms"
+            )
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} stage(s) slower than the baseline by more than "
+                f"{options['tolerance']:.0%}"
+            )
+        self.stdout.write("No regression against the baseline")
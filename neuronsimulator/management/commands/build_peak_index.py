@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+import wormfunconn as wfc
+from django.core.management import BaseCommand, CommandError
+from neuronsimulator.forms import ParamForm
+from neuronsimulator.utils import PeakAmplitudeIndex
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Builds the peak amplitude index used to pick top N responses, for each strain and "
+        "stimulus template (stim_type with nt, t_max and the form's default stimulus values)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strain",
+            action="append",
+            dest="strains",
+            choices=wfc.strains,
+            help="strain to index (repeatable), default: all strains",
+        )
+        parser.add_argument(
+            "--stim-type",
+            action="append",
+            dest="stim_types",
+            help="stim_type to index (repeatable), default: all stim_types",
+        )
+        parser.add_argument(
+            "--stim-neu-id",
+            action="append",
+            dest="stim_neu_ids",
+            help="stimulated neuron to index (repeatable), default: all stimulable neurons",
+        )
+        parser.add_argument(
+            "--nt", type=int, default=ParamForm.base_fields["nt"].initial
+        )
+        parser.add_argument(
+            "--t-max", type=float, default=ParamForm.base_fields["t_max"].initial
+        )
+
+    def handle(self, *args, **options):
+        strains = options["strains"] or wfc.strains
+        stim_types = options["stim_types"] or wfc2plot.get_stim_type_list()
+        form_opt_field_dict = wfc2plot.get_form_opt_field_dict()
+
+        for strain_type in strains:
+            funatlas, app_error_dict = wfc2plot().get_funatlas(strain_type)
+            if funatlas is None:
+                raise CommandError(f"{strain_type}: {app_error_dict}")
+            stim_neu_ids = options["stim_neu_ids"] or [
+                str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=True)
+            ]
+            resp_neu_ids = [
+                str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=False)
+            ]
+            resp_neu_index = {neu_id: j for j, neu_id in enumerate(resp_neu_ids)}
+
+            for stim_type in stim_types:
+                start = time.perf_counter()
+                # the stimulus template: defaults of the form for every stim kwarg
+                reqd_params_dict = {}
+                for key in wfc2plot.get_reqd_params_keys(stim_type):
+                    if key in form_opt_field_dict:
+                        reqd_params_dict[key] = form_opt_field_dict[key]["default"]
+                reqd_params_dict.update(
+                    {
+                        "strain_type": strain_type,
+                        "stim_type": stim_type,
+                        "stim_neu_id": "",
+                        "resp_neu_ids": [],
+                        "nt": options["nt"],
+                        "t_max": options["t_max"],
+                        "top_n": None,
+                    }
+                )
+                template_key = wfc2plot().get_stimulus_template_key(reqd_params_dict)
+                stim, app_error_dict = wfc2plot().get_stimulus(
+                    funatlas, reqd_params_dict
+                )
+                if stim.size == 0:
+                    raise CommandError(f"{strain_type}, {stim_type}: {app_error_dict}")
+
+                peaks = np.full((len(stim_neu_ids), len(resp_neu_ids)), np.nan)
+                for i, stim_neu_id in enumerate(stim_neu_ids):
+                    # responses of all neurons, without top_n
+                    (
+                        resp,
+                        labels,
+                        confidences,
+                        msg,
+                        app_error_dict,
+                    ) = wfc2plot().get_responses_to_stimulus(
+                        funatlas, stim, {**reqd_params_dict, "stim_neu_id": stim_neu_id}
+                    )
+                    if app_error_dict:
+                        self.stderr.write(
+                            f"{strain_type}, {stim_neu_id}: {app_error_dict}"
+                        )
+                        continue
+                    if resp.size == 0:
+                        continue
+                    resp_neu_id_rank_dict = wfc2plot.resp_labels_to_dict(labels)
+                    row_peaks = np.max(np.abs(resp), axis=1)
+                    for resp_neu_id, peak in zip(resp_neu_id_rank_dict, row_peaks):
+                        peaks[i, resp_neu_index[resp_neu_id]] = peak
+
+                path = PeakAmplitudeIndex.save(
+                    template_key, stim_neu_ids, resp_neu_ids, peaks
+                )
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"Indexed {strain_type}, {stim_type}: {len(stim_neu_ids)} stimulated "
+                    f"neuron(s) in {elapsed:.1f} s -> {path}"
+                )
@@ -0,0 +1,61 @@
+import os
+import time
+
+import wormfunconn as wfc
+from django.core.management import BaseCommand, CommandError
+from neuronsimulator.utils import AtlasRegistry
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+from wormfunconn import FunctionalAtlas
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Converts atlas pickles to the memory-mapped layout (.npy arrays, including the "
+        "flattened kernels, and a JSON manifest) "
+        "that is opened with np.load(mmap_mode='r') instead of being unpickled"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "atlas_filenames",
+            nargs="*",
+            type=str,
+            help="atlas pickle file names, default: the atlas of every strain",
+        )
+        parser.add_argument(
+            "--atlas-dir",
+            default=wfc2plot.get_atlas_folder(),
+            help="folder containing the atlas pickles",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=None,
+            help="folder to write the layouts to, default: the atlas folder",
+        )
+
+    def handle(self, *args, **options):
+        atlas_dir = options["atlas_dir"]
+        output_dir = options["output_dir"] or atlas_dir
+        fnames = options["atlas_filenames"] or sorted(
+            {wfc2plot.get_atlas_fname(strain_type) for strain_type in wfc.strains}
+        )
+        for fname in fnames:
+            source_path = os.path.join(atlas_dir, fname)
+            if not os.path.isfile(source_path):
+                raise CommandError(f"Atlas file was not found: {source_path}")
+            start = time.perf_counter()
+            funatlas = FunctionalAtlas.from_file(atlas_dir, fname)
+            layout_dir = AtlasRegistry.get_layout_dir(output_dir, fname)
+            manifest = AtlasRegistry.save_atlas_layout(
+                funatlas, layout_dir, source_path
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Converted {fname} to {layout_dir} in {elapsed:.2f} s: "
+                f"{len(manifest['arrays'])} memory-mapped array(s) "
+                f"({', '.join(manifest['arrays'])}), "
+                f"{len(manifest['kernels'])} flattened kernel array(s) "
+                f"({', '.join(manifest['kernels'])}), "
+                f"{len(manifest['object_attrs'])} pickled attribute(s)"
+            )
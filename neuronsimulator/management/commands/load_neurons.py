@@ -1,24 +1,89 @@
+import time
 from csv import DictReader
 
-from django.core.management import BaseCommand
+import wormfunconn as wfc
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 from neuronsimulator.models import Neuron
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+# rows per bulk insert/delete query
+BATCH_SIZE = 500
 
 
 class Command(BaseCommand):
     # Show this when the user types help
-    help = "Loads data from a neuron list into the database"
+    help = (
+        "Syncs the neurons in the database with a neuron list and/or the neurons of the "
+        "strains' atlases"
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("neuron_list_filename", type=str)
+        parser.add_argument("neuron_list_filename", type=str, nargs="?")
+        parser.add_argument(
+            "--from-atlas",
+            action="store_true",
+            help="also load the neurons of the atlas of every strain",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="delete the neurons that are not in the neuron list or atlases (except "
+            "those of a strain loaded by load_strains)",
+        )
 
     def handle(self, *args, **options):
-        print("Loading neuron data")
-        for row in DictReader(
-            open(options["neuron_list_filename"]),
-            dialect="excel-tab",
-        ):
-            # print(row['NAME'])
-            neuron, created = Neuron.objects.get_or_create(name=row["NAME"])
-            if created:
-                print(f"Created new record: Neuron:{neuron}")
-            neuron.save()
+        if not options["neuron_list_filename"] and not options["from_atlas"]:
+            raise CommandError("Give a neuron list filename and/or --from-atlas")
+        start = time.perf_counter()
+        names = set()
+        if options["neuron_list_filename"]:
+            names.update(self.read_neuron_list(options["neuron_list_filename"]))
+        if options["from_atlas"]:
+            names.update(self.read_atlas_neuron_ids())
+
+        with transaction.atomic():
+            existing = set(Neuron.objects.values_list("name", flat=True))
+            to_create = sorted(names - existing)
+            Neuron.objects.bulk_create(
+                [Neuron(name=name) for name in to_create],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            deleted = 0
+            if options["prune"]:
+                # neurons still in a strain loaded by load_strains are kept
+                to_delete = list(
+                    Neuron.objects.exclude(name__in=names)
+                    .filter(strain_neurons__isnull=True)
+                    .values_list("pk", flat=True)
+                )
+                for i in range(0, len(to_delete), BATCH_SIZE):
+                    end = i + BATCH_SIZE
+                    batch = to_delete[i:end]
+                    deleted += Neuron.objects.filter(pk__in=batch).delete()[0]
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Synced {len(names)} neurons: {len(to_create)} created, {deleted} deleted, "
+            f"{len(names & existing)} unchanged, {len(existing - names) - deleted} not in "
+            f"the list kept, in {elapsed * 1000:.1f} ms"
+        )
+
+    def read_neuron_list(self, neuron_list_filename):
+        try:
+            with open(neuron_list_filename, newline="") as neuron_list_file:
+                for row in DictReader(neuron_list_file, dialect="excel-tab"):
+                    name = row["NAME"].strip()
+                    if name:
+                        yield name
+        except OSError as e:
+            raise CommandError(f"Cannot read {neuron_list_filename}: {e}")
+
+    def read_atlas_neuron_ids(self):
+        for strain_type in wfc.strains:
+            funatlas, app_error_dict = wfc2plot().get_funatlas(strain_type)
+            if funatlas is None:
+                raise CommandError(f"{strain_type}: {app_error_dict}")
+            for neu_id in funatlas.get_neuron_ids(stim=False):
+                yield str(neu_id)
@@ -0,0 +1,72 @@
+import time
+
+import wormfunconn as wfc
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from neuronsimulator.forms import clear_form_schemas
+from neuronsimulator.models import Neuron, Strain, StrainNeuron
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Loads the neurons of each strain's atlas, and whether they can be stimulated, "
+        "into the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strain",
+            action="append",
+            dest="strains",
+            choices=wfc.strains,
+            help="strain to load (repeatable), default: all strains",
+        )
+
+    def handle(self, *args, **options):
+        strains = options["strains"] or wfc.strains
+        for strain_type in strains:
+            start = time.perf_counter()
+            w2p = wfc2plot()
+            funatlas, app_error_dict = w2p.get_funatlas(strain_type)
+            if funatlas is None:
+                raise CommandError(f"{strain_type}: {app_error_dict}")
+            atlas_version = w2p.get_atlas_version(strain_type)
+            neuron_ids = [str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=False)]
+            stim_neuron_ids = {
+                str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=True)
+            }
+
+            with transaction.atomic():
+                strain, created = Strain.objects.update_or_create(
+                    name=strain_type, defaults={"atlas_sha256": atlas_version}
+                )
+                Neuron.objects.bulk_create(
+                    [Neuron(name=neu_id) for neu_id in neuron_ids],
+                    ignore_conflicts=True,
+                )
+                neuron_pk_dict = dict(
+                    Neuron.objects.filter(name__in=neuron_ids).values_list("name", "pk")
+                )
+                # memberships are replaced as a whole, their order follows the atlas
+                StrainNeuron.objects.filter(strain=strain).delete()
+                StrainNeuron.objects.bulk_create(
+                    [
+                        StrainNeuron(
+                            strain=strain,
+                            neuron_id=neuron_pk_dict[neu_id],
+                            stimulable=neu_id in stim_neuron_ids,
+                            position=position,
+                        )
+                        for position, neu_id in enumerate(neuron_ids)
+                    ]
+                )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Loaded strain {strain_type}: {len(neuron_ids)} neurons, "
+                f"{len(stim_neuron_ids)} stimulable, in {elapsed:.2f} s"
+            )
+        # neuron choices of this process are built from the database again
+        clear_form_schemas()
+        wfc2plot.clear_neuron_ids_by_strain()
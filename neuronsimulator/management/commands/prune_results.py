@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from neuronsimulator.models import SimulationResult
+from neuronsimulator.store import prune_results
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Deletes the least recently used simulation results of the result store beyond a "
+        "number of results or a total size, and the results not used for some days"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-rows",
+            type=int,
+            default=settings.SIMULATION_RESULT_STORE_MAX_ROWS,
+            help="results to keep, 0 for no limit (default SIMULATION_RESULT_STORE_MAX_ROWS)",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=settings.SIMULATION_RESULT_STORE_MAX_BYTES,
+            help="size of the compressed responses to keep, 0 for no limit "
+            "(default SIMULATION_RESULT_STORE_MAX_BYTES)",
+        )
+        parser.add_argument(
+            "--older-than",
+            type=float,
+            default=None,
+            metavar="DAYS",
+            help="also delete the results not used for this many days",
+        )
+
+    def handle(self, *args, **options):
+        max_age = None
+        if options["older_than"] is not None:
+            max_age = timedelta(days=options["older_than"])
+        deleted = prune_results(options["max_rows"], options["max_bytes"], max_age)
+        self.stdout.write(
+            f"Deleted {deleted} simulation results, "
+            f"{SimulationResult.objects.count()} left"
+        )
@@ -0,0 +1,239 @@
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import wormfunconn as wfc
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import BaseCommand, CommandError
+from neuronsimulator.cache import get_simulation_cache
+from neuronsimulator.executor import (
+    get_mp_context,
+    init_worker_process,
+    warm_output_for_plot,
+)
+from neuronsimulator.forms import ParamForm, get_form_init_dict
+from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "Fills the simulation result and plot caches for every stimulable neuron of each "
+        "strain, at the form's default parameters or a grid of parameters, in parallel. "
+        "The caches are filled by worker processes, so with a cache local to each process "
+        "(the default ByteBudgetLocMemCache) they are lost when the command exits and only "
+        "the database result store (SIMULATION_RESULT_STORE) is warmed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strain",
+            action="append",
+            dest="strains",
+            choices=wfc.strains,
+            help="strain to warm (repeatable), default: all strains",
+        )
+        parser.add_argument(
+            "--neuron",
+            action="append",
+            dest="neurons",
+            help="stimulated neuron to warm (repeatable), default: all stimulable neurons",
+        )
+        parser.add_argument(
+            "--grid",
+            action="append",
+            default=[],
+            metavar="FIELD=VALUE,VALUE",
+            help="values of a form field to combine with the other fields' values "
+            "(repeatable), e.g. --grid nt=1000,10000 --grid stim_type=rectangular,delta",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1, help="worker processes"
+        )
+        parser.add_argument(
+            "--state",
+            default=os.path.join(settings.MEDIA_ROOT, "warm_cache.state"),
+            help="file of the cache keys already warmed, to resume an interrupted run",
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="ignore and clear the state file"
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=int,
+            default=20,
+            help="report progress every N parameter sets",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="run even if the cache is local to each process",
+        )
+
+    def handle(self, *args, **options):
+        cache = get_simulation_cache()
+        # with a process-local cache only the result store is shared with the server
+        local_cache = isinstance(cache, (LocMemCache, DummyCache))
+        if (
+            local_cache
+            and not settings.SIMULATION_RESULT_STORE
+            and not options["force"]
+        ):
+            raise CommandError(
+                f"The simulation cache ({type(cache).__name__}) is not shared with the "
+                "server processes, set SIMULATION_CACHE_BACKEND to a shared backend "
+                "(e.g. django.core.cache.backends.filebased.FileBasedCache), enable "
+                "SIMULATION_RESULT_STORE or use --force"
+            )
+
+        if local_cache:
+            warmed = (
+                "only the result store is warmed"
+                if settings.SIMULATION_RESULT_STORE
+                else "nothing is kept"
+            )
+            self.stdout.write(
+                f"The simulation cache ({type(cache).__name__}) is local to each "
+                f"process, {warmed}"
+            )
+
+        grid = self.parse_grid(options["grid"])
+        tasks = self.get_tasks(
+            options["strains"] or wfc.strains, options["neurons"], grid
+        )
+        state_path = options["state"]
+        if options["restart"] and os.path.exists(state_path):
+            os.remove(state_path)
+        done_keys = self.read_state(state_path)
+        # plots cached by the server or another run need no simulation either
+        pending = [
+            (key, params)
+            for key, params in tasks
+            if key not in done_keys and not cache.has_key(key)
+        ]
+        self.stdout.write(
+            f"{len(tasks)} parameter sets, {len(tasks) - len(pending)} already cached, "
+            f"{len(pending)} to warm with {options['workers']} workers"
+        )
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        n_done = 0
+        n_errors = 0
+        with open(state_path, "a") as state_file, ProcessPoolExecutor(
+            max_workers=options["workers"],
+            mp_context=get_mp_context(),
+            initializer=init_worker_process,
+        ) as executor:
+            # a bounded number of submitted tasks keeps the memory flat for large grids
+            task_iter = iter(pending)
+            futures = {}
+            while True:
+                for key, params in itertools.islice(
+                    task_iter, 2 * options["workers"] - len(futures)
+                ):
+                    futures[executor.submit(warm_output_for_plot, params)] = (
+                        key,
+                        params,
+                    )
+                if not futures:
+                    break
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key, params = futures.pop(future)
+                    try:
+                        errors = future.result()
+                    except Exception as e:
+                        errors = {"warm_cache_error": str(e)}
+                    n_done += 1
+                    if errors:
+                        n_errors += 1
+                        self.stderr.write(
+                            f"{params['strain_type']} {params['stim_neu_id']}: {errors}"
+                        )
+                    else:
+                        # errors are retried when resuming
+                        state_file.write(key + "\n")
+                        state_file.flush()
+                    if n_done % options["progress_every"] == 0 or n_done == len(
+                        pending
+                    ):
+                        self.write_progress(n_done, len(pending), start)
+        self.stdout.write(
+            f"Warmed {n_done - n_errors} parameter sets, {n_errors} errors, "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+    def write_progress(self, n_done, n_total, start):
+        elapsed = time.perf_counter() - start
+        rate = n_done / elapsed if elapsed > 0 else 0.0
+        eta = (n_total - n_done) / rate if rate > 0 else 0.0
+        self.stdout.write(
+            f"{n_done}/{n_total} ({100 * n_done / n_total:.0f}%), {rate:.1f} sets/s, "
+            f"ETA {eta:.0f} s"
+        )
+
+    @staticmethod
+    def parse_grid(grid_options):
+        grid = {}
+        for grid_option in grid_options:
+            field, sep, values = grid_option.partition("=")
+            if not sep or field not in ParamForm.base_fields:
+                raise CommandError(
+                    f"Invalid --grid {grid_option}, expected FIELD=VALUES"
+                )
+            grid[field] = values.split(",")
+        return grid
+
+    def get_tasks(self, strains, neurons, grid):
+        """
+        get (plot cache key, form params) of every stimulable neuron of each strain for each
+        combination of the grid; the keys change with the atlas version
+        """
+        form_init_dict = get_form_init_dict()
+        grid_fields = list(grid)
+        tasks = []
+        seen_keys = set()
+        for strain_type in strains:
+            neuron_ids, app_error_dict = wfc2plot().get_neuron_ids(strain_type)
+            if app_error_dict:
+                raise CommandError(f"{strain_type}: {app_error_dict}")
+            if neurons:
+                neuron_ids = [neu_id for neu_id in neuron_ids if neu_id in neurons]
+            for values in itertools.product(*grid.values()):
+                for neu_id in neuron_ids:
+                    form_data_dict = {
+                        **form_init_dict,
+                        **dict(zip(grid_fields, values)),
+                        "strain_type": strain_type,
+                        "stim_neu_id": str(neu_id),
+                    }
+                    my_form = ParamForm(form_data_dict)
+                    if not my_form.is_valid():
+                        raise CommandError(
+                            f"Invalid parameters {form_data_dict}: "
+                            f"{my_form.errors.get_json_data()}"
+                        )
+                    w2p = wfc2plot()
+                    reqd_params_dict, app_error_dict = w2p.get_reqd_params_dict(
+                        my_form.cleaned_data
+                    )
+                    key = w2p.get_params_key(
+                        reqd_params_dict, wfc2plot.get_plot_cache_prefix()
+                    )
+                    # grid values of fields not used by a stim_type give the same key
+                    if key not in seen_keys:
+                        seen_keys.add(key)
+                        tasks.append((key, my_form.cleaned_data))
+        return tasks
+
+    @staticmethod
+    def read_state(state_path):
+        if not os.path.exists(state_path):
+            return set()
+        with open(state_path) as state_file:
+            return {line.strip() for line in state_file if line.strip()}
@@ -0,0 +1,260 @@
+import bisect
+import math
+import threading
+
+# latency buckets in seconds, from fast cache hits to long simulations
+DEFAULT_BUCKETS = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+]
+
+# metrics rendered by render_metrics, in registration order
+_registry = []
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Metric:
+    """
+    base class of the metrics in Prometheus text format (version 0.0.4), kept in this process
+    each server process has its own values, scrape every worker or run one process
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def get_label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get_samples(self):
+        """
+        yield (suffix, labels as (name, value) pairs, value)
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield "", tuple(zip(self.labelnames, label_values)), value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labels, value in self.get_samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        # without labels the metric has one sample, which starts at 0
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        # without labels the metric has one sample, which starts at 0
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class FunctionMetric(Metric):
+    """
+    counter or gauge whose samples are read when the metrics are rendered, for values
+    already counted elsewhere (e.g. StimulusCache.hits)
+    func: returns a list of (dict of labels, value)
+    """
+
+    def __init__(self, name, documentation, func, metric_type, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self.metric_type = metric_type
+
+    def get_samples(self):
+        for labels, value in self.func():
+            yield "", tuple(zip(self.labelnames, self.get_label_values(labels))), value
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = list(buckets) + [math.inf]
+
+    def observe(self, value, **labels):
+        key = self.get_label_values(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def get_samples(self):
+        with self._lock:
+            values = sorted((key, (list(c), s)) for key, (c, s) in self._values.items())
+        for label_values, (counts, total) in values:
+            labels = tuple(zip(self.labelnames, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", labels + (("le", format_value(bound)),), cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+REQUEST_DURATION = Histogram(
+    "funsim_request_duration_seconds",
+    "Duration of requests by view",
+    labelnames=["view"],
+)
+STAGE_DURATION = Histogram(
+    "funsim_stage_duration_seconds",
+    "Duration of the stages of the simulation pipeline (WormfunconnToPlot) and views",
+    labelnames=["stage"],
+)
+CACHE_REQUESTS = Counter(
+    "funsim_cache_requests_total",
+    "Lookups in the atlas, neuron, response, result store and plot caches by result (hit or miss)",
+    labelnames=["cache", "result"],
+)
+ATLAS_LOADS = Counter(
+    "funsim_atlas_loads_total",
+    "Atlases loaded from file by this process",
+    labelnames=["atlas"],
+)
+SIMULATIONS_IN_PROGRESS = Gauge(
+    "funsim_simulations_in_progress",
+    "Simulations running in this process",
+)
+POOL_TASKS_IN_FLIGHT = Gauge(
+    "funsim_pool_tasks_in_flight",
+    "Simulations submitted to a worker pool and not finished yet",
+    labelnames=["pool"],
+)
+
+
+def get_stimulus_cache_requests():
+    from neuronsimulator.utils import stimulus_cache
+
+    return [
+        ({"result": "hit"}, stimulus_cache.hits),
+        ({"result": "miss"}, stimulus_cache.misses),
+    ]
+
+
+def get_stimulus_cache_evictions():
+    from neuronsimulator.utils import stimulus_cache
+
+    return [({}, stimulus_cache.evictions)]
+
+
+def get_result_cache_evictions():
+    # only ByteBudgetLocMemCache counts its evictions
+    from neuronsimulator.cache import get_simulation_cache
+
+    evictions = getattr(get_simulation_cache(), "evictions", None)
+    return [] if evictions is None else [({}, evictions)]
+
+
+def get_result_cache_bytes():
+    from neuronsimulator.cache import get_simulation_cache
+
+    total_bytes = getattr(get_simulation_cache(), "total_bytes", None)
+    return [] if total_bytes is None else [({}, total_bytes)]
+
+
+STIMULUS_CACHE_REQUESTS = FunctionMetric(
+    "funsim_stimulus_cache_requests_total",
+    "Lookups in the stimulus waveform cache by result (hit or miss)",
+    get_stimulus_cache_requests,
+    "counter",
+    labelnames=["result"],
+)
+STIMULUS_CACHE_EVICTIONS = FunctionMetric(
+    "funsim_stimulus_cache_evictions_total",
+    "Stimulus waveforms evicted from the stimulus cache",
+    get_stimulus_cache_evictions,
+    "counter",
+)
+RESULT_CACHE_EVICTIONS = FunctionMetric(
+    "funsim_result_cache_evictions_total",
+    "Entries evicted from the simulation result cache",
+    get_result_cache_evictions,
+    "counter",
+)
+RESULT_CACHE_BYTES = FunctionMetric(
+    "funsim_result_cache_bytes",
+    "Size of the values in the simulation result cache",
+    get_result_cache_bytes,
+    "gauge",
+)
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.22 on 2026-10-18 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Strain",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="The unique name of the worm strain, e.g. wild-type",
+                        max_length=20,
+                        unique=True,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "strain",
+                "verbose_name_plural": "strains",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="StrainNeuron",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "stimulable",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Whether the neuron can be stimulated in the atlas of the strain",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveIntegerField(
+                        help_text="The position of the neuron in the atlas of the strain"
+                    ),
+                ),
+                (
+                    "neuron",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="strain_neurons",
+                        to="neuronsimulator.neuron",
+                    ),
+                ),
+                (
+                    "strain",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="strain_neurons",
+                        to="neuronsimulator.strain",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "strain neuron",
+                "verbose_name_plural": "strain neurons",
+                "ordering": ["strain", "position"],
+                "indexes": [
+                    models.Index(
+                        fields=["strain", "stimulable", "position"],
+                        name="strain_stimulable_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="strainneuron",
+            constraint=models.UniqueConstraint(
+                fields=("strain", "neuron"), name="unique_strain_neuron"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.22 on 2026-10-18 02:36
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0002_strain_strainneuron"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimulationJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        help_text="Whether the simulation is pending, done or failed",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "params",
+                    models.JSONField(
+                        help_text="The ParamForm parameters of the simulation"
+                    ),
+                ),
+                (
+                    "result",
+                    models.JSONField(
+                        blank=True,
+                        help_text="The output of get_all_output_for_plot, once done",
+                        null=True,
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(
+                        blank=True, help_text="The error of a failed simulation"
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "simulation job",
+                "verbose_name_plural": "simulation jobs",
+                "ordering": ["-created"],
+            },
+        ),
+    ]
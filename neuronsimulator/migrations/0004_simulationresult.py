@@ -0,0 +1,51 @@
+# Generated by Django 4.2.22 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0003_simulationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimulationResult",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="The hash of the canonical parameters and the atlas version",
+                        max_length=80,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "resp",
+                    models.BinaryField(
+                        help_text="The responses as a zlib-compressed float32 .npy file"
+                    ),
+                ),
+                (
+                    "labels",
+                    models.JSONField(help_text="The names of the responding neurons"),
+                ),
+                (
+                    "confidences",
+                    models.JSONField(
+                        blank=True,
+                        help_text="The confidence of each response",
+                        null=True,
+                    ),
+                ),
+                ("msg", models.TextField(blank=True, null=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "simulation result",
+                "verbose_name_plural": "simulation results",
+            },
+        ),
+    ]
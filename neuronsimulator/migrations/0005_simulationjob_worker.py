@@ -0,0 +1,22 @@
+# Generated by Django 4.2.22 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0004_simulationresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="simulationjob",
+            name="worker",
+            field=models.CharField(
+                blank=True,
+                help_text="The host and process id of the server process running the simulation",
+                max_length=100,
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.22 on 2026-10-18 03:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def set_sizes(apps, schema_editor):
+    # results stored before the size field, for the byte limit of the store
+    SimulationResult = apps.get_model("neuronsimulator", "SimulationResult")
+    for result in SimulationResult.objects.only("pk", "resp").iterator():
+        SimulationResult.objects.filter(pk=result.pk).update(size=len(result.resp))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0005_simulationjob_worker"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="simulationresult",
+            name="last_accessed",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="When the result was last stored or read, for LRU pruning",
+            ),
+        ),
+        migrations.AddField(
+            model_name="simulationresult",
+            name="size",
+            field=models.PositiveIntegerField(
+                default=0, help_text="The size of the compressed responses in bytes"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="simulationresult",
+            index=models.Index(
+                fields=["last_accessed"], name="result_last_accessed_idx"
+            ),
+        ),
+        migrations.RunPython(set_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.22 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("neuronsimulator", "0006_simulationresult_lru"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="strain",
+            name="atlas_sha256",
+            field=models.CharField(
+                blank=True,
+                help_text="The version (sha256) of the atlas the neurons of the strain were loaded from",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 
 
 class Neuron(models.Model):
@@ -17,3 +20,145 @@ class Neuron(models.Model):
 
     def __str__(self):
         return str(self.name)
+
+
+class Strain(models.Model):
+    # store worm strains with a functional atlas
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(
+        max_length=20,
+        unique=True,
+        help_text="The unique name of the worm strain, e.g. wild-type",
+    )
+    atlas_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="The version (sha256) of the atlas the neurons of the strain were loaded from",
+    )
+
+    class Meta:
+        verbose_name = "strain"
+        verbose_name_plural = "strains"
+        ordering = ["name"]
+
+    def __str__(self):
+        return str(self.name)
+
+
+class StrainNeuron(models.Model):
+    # store which neurons are in the atlas of a strain, populated by the load_strains command
+    id = models.AutoField(primary_key=True)
+    strain = models.ForeignKey(
+        Strain,
+        on_delete=models.CASCADE,
+        related_name="strain_neurons",
+    )
+    neuron = models.ForeignKey(
+        Neuron,
+        on_delete=models.CASCADE,
+        related_name="strain_neurons",
+    )
+    stimulable = models.BooleanField(
+        default=False,
+        help_text="Whether the neuron can be stimulated in the atlas of the strain",
+    )
+    position = models.PositiveIntegerField(
+        help_text="The position of the neuron in the atlas of the strain",
+    )
+
+    class Meta:
+        verbose_name = "strain neuron"
+        verbose_name_plural = "strain neurons"
+        ordering = ["strain", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["strain", "neuron"], name="unique_strain_neuron"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["strain", "stimulable", "position"],
+                name="strain_stimulable_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.strain}: {self.neuron}"
+
+
+class SimulationJob(models.Model):
+    # store simulations run in the background by the job queue (see jobs.py)
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        help_text="Whether the simulation is pending, done or failed",
+    )
+    params = models.JSONField(help_text="The ParamForm parameters of the simulation")
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="The output of get_all_output_for_plot, once done",
+    )
+    error = models.TextField(blank=True, help_text="The error of a failed simulation")
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="The host and process id of the server process running the simulation",
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "simulation job"
+        verbose_name_plural = "simulation jobs"
+        ordering = ["-created"]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class SimulationResult(models.Model):
+    # store computed responses, shared by all processes and kept across restarts (see store.py)
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(
+        max_length=80,
+        unique=True,
+        help_text="The hash of the canonical parameters and the atlas version",
+    )
+    resp = models.BinaryField(
+        help_text="The responses as a zlib-compressed float32 .npy file"
+    )
+    labels = models.JSONField(help_text="The names of the responding neurons")
+    confidences = models.JSONField(
+        null=True, blank=True, help_text="The confidence of each response"
+    )
+    msg = models.TextField(null=True, blank=True)
+    size = models.PositiveIntegerField(
+        default=0, help_text="The size of the compressed responses in bytes"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    last_accessed = models.DateTimeField(
+        default=timezone.now,
+        help_text="When the result was last stored or read, for LRU pruning",
+    )
+
+    class Meta:
+        verbose_name = "simulation result"
+        verbose_name_plural = "simulation results"
+        indexes = [
+            models.Index(fields=["last_accessed"], name="result_last_accessed_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.key)
@@ -0,0 +1,92 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+# names of the saved profiles and reports, see save_profile
+PROFILE_NAME_RE = re.compile(r"^[\w-]+\.(prof|txt)$")
+
+
+def is_profile_request(request):
+    """
+    whether a staff user asked to profile the request, with profile=1 or an X-Profile: 1 header
+    """
+    if not request.user.is_staff:
+        return False
+    return request.GET.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+
+
+def save_profile(profiler, view_name):
+    """
+    save the profile (for pstats or snakeviz) and a text report of the top
+    settings.PROFILE_TOP_N functions by cumulative time to settings.PROFILE_ROOT
+    return the base name of the files and the report
+    """
+    os.makedirs(settings.PROFILE_ROOT, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"{view_name}-{timestamp}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(settings.PROFILE_ROOT, f"{name}.prof"))
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(settings.PROFILE_TOP_N)
+    report = stream.getvalue()
+    with open(os.path.join(settings.PROFILE_ROOT, f"{name}.txt"), "w") as report_file:
+        report_file.write(report)
+    return name, report
+
+
+def get_profile_path(fname):
+    """
+    get the path of a saved profile or report, None for names not made by save_profile
+    """
+    if not PROFILE_NAME_RE.match(fname):
+        return None
+    path = os.path.join(settings.PROFILE_ROOT, fname)
+    return path if os.path.isfile(path) else None
+
+
+def staff_profiling(view_name):
+    """
+    decorator running a view under cProfile when is_profile_request; the response is then
+    the text report of the top functions by cumulative time, with the download urls of the
+    saved profile and report
+    the view should bypass the caches for profiled requests (see WormfunconnToPlot), or a
+    popular parameter set only profiles a cache hit
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_profile_request(request):
+                return view(request, *args, **kwargs)
+            profiler = cProfile.Profile()
+            response = profiler.runcall(view, request, *args, **kwargs)
+            name, report = save_profile(profiler, view_name)
+            logger.info("Saved profile %s of %s", name, request.get_full_path())
+            urls = [
+                request.build_absolute_uri(reverse("profile_download", args=[fname]))
+                for fname in [f"{name}.prof", f"{name}.txt"]
+            ]
+            # the stage timings show which stages ran
+            header = (
+                f"Profile of {request.get_full_path()} (status {response.status_code})\n"
+                f"Server-Timing: {response.get('Server-Timing', '')}\n"
+                f"Download: {urls[0]}\nReport: {urls[1]}\n\n"
+            )
+            return HttpResponse(header + report, content_type="text/plain")
+
+        return wrapper
+
+    return decorator
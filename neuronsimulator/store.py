@@ -0,0 +1,138 @@
+import io
+import logging
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, Sum
+from django.utils import timezone
+from neuronsimulator.models import SimulationResult
+
+logger = logging.getLogger(__name__)
+
+# results per delete query when pruning
+PRUNE_BATCH_SIZE = 500
+
+
+def resp_to_blob(resp):
+    """
+    compress responses as a float32 .npy file
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(resp, dtype=np.float32), allow_pickle=False)
+    return zlib.compress(buffer.getvalue())
+
+
+def blob_to_resp(blob):
+    """
+    read responses compressed by resp_to_blob, as float64 like those of the atlas
+    """
+    resp = np.load(io.BytesIO(zlib.decompress(bytes(blob))), allow_pickle=False)
+    return resp.astype(np.float64)
+
+
+def has_stored_result(key):
+    """
+    whether a simulation result is stored under key, without reading it
+    """
+    if not settings.SIMULATION_RESULT_STORE:
+        return False
+    try:
+        return SimulationResult.objects.filter(key=key).exists()
+    except DatabaseError as e:
+        logger.warning("Could not read the simulation result store: %s", e)
+        return False
+
+
+def get_stored_result(key):
+    """
+    get (resp, labels, confidences, msg) of a simulation result stored under key, None if
+    the store is disabled (settings.SIMULATION_RESULT_STORE), the key is missing or the
+    database can not be read
+    """
+    if not settings.SIMULATION_RESULT_STORE:
+        return None
+    try:
+        stored = SimulationResult.objects.filter(key=key).first()
+    except DatabaseError as e:
+        logger.warning("Could not read the simulation result store: %s", e)
+        return None
+    if stored is None:
+        return None
+    try:
+        SimulationResult.objects.filter(pk=stored.pk).update(
+            last_accessed=timezone.now()
+        )
+    except DatabaseError as e:
+        logger.warning("Could not update the simulation result store: %s", e)
+    confidences = stored.confidences
+    if confidences is not None:
+        confidences = np.array(confidences)
+    return blob_to_resp(stored.resp), np.array(stored.labels), confidences, stored.msg
+
+
+def store_result(key, resp, labels, confidences, msg):
+    """
+    store a simulation result under key; the key is a hash of the parameters and atlas
+    version, so a result computed again by another process is not stored twice
+    """
+    if not settings.SIMULATION_RESULT_STORE:
+        return
+    if confidences is not None:
+        confidences = np.asarray(confidences, dtype=float).tolist()
+    blob = resp_to_blob(resp)
+    result = SimulationResult(
+        key=key,
+        resp=blob,
+        labels=np.asarray(labels).tolist(),
+        confidences=confidences,
+        msg=None if msg is None else str(msg),
+        size=len(blob),
+    )
+    try:
+        SimulationResult.objects.bulk_create([result], ignore_conflicts=True)
+        prune_results(
+            settings.SIMULATION_RESULT_STORE_MAX_ROWS,
+            settings.SIMULATION_RESULT_STORE_MAX_BYTES,
+        )
+    except DatabaseError as e:
+        logger.warning("Could not write to the simulation result store: %s", e)
+
+
+def prune_results(max_rows=0, max_bytes=0, max_age=None):
+    """
+    delete the least recently used results beyond max_rows results or max_bytes of
+    compressed responses (0 for no limit), and those not used for max_age (a timedelta)
+    return the number of deleted results
+    """
+    deleted = 0
+    if max_age is not None:
+        deleted += SimulationResult.objects.filter(
+            last_accessed__lt=timezone.now() - max_age
+        ).delete()[0]
+    if not max_rows and not max_bytes:
+        return deleted
+    total = SimulationResult.objects.aggregate(rows=Count("pk"), size=Sum("size"))
+    n_rows = total["rows"]
+    n_bytes = total["size"] or 0
+    if (not max_rows or n_rows <= max_rows) and (not max_bytes or n_bytes <= max_bytes):
+        return deleted
+    to_delete = []
+    lru_results = SimulationResult.objects.order_by("last_accessed", "pk").values_list(
+        "pk", "size"
+    )
+    for pk, size in lru_results.iterator():
+        if (not max_rows or n_rows <= max_rows) and (
+            not max_bytes or n_bytes <= max_bytes
+        ):
+            break
+        to_delete.append(pk)
+        n_rows -= 1
+        n_bytes -= size
+    for start in range(0, len(to_delete), PRUNE_BATCH_SIZE):
+        end = start + PRUNE_BATCH_SIZE
+        deleted += SimulationResult.objects.filter(
+            pk__in=to_delete[start:end]
+        ).delete()[0]
+    return deleted
@@ -1,11 +1,63 @@
+import io
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
 from urllib.parse import parse_qs, urlparse
 
-from django.core.management import call_command
-from django.test import TestCase
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.management import CommandError, call_command
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    tag,
+)
 from django.urls import reverse
-from neuronsimulator.forms import ParamForm
-from neuronsimulator.models import Neuron
+from django.utils import timezone
+from neuronsimulator import views
+from neuronsimulator.benchmark import (
+    STAGES,
+    compare_to_baseline,
+    read_results,
+    run_benchmark,
+)
+from neuronsimulator.cache import (
+    ByteBudgetLocMemCache,
+    StimulusCache,
+    get_simulation_cache,
+)
+from neuronsimulator.executor import get_executor, shutdown_executor
+from neuronsimulator.export import iter_npy_bytes
+from neuronsimulator.forms import ParamForm, get_form_schema
+from neuronsimulator.jobs import (
+    fail_orphaned_jobs,
+    get_worker_id,
+    shutdown_job_executor,
+)
+from neuronsimulator.models import (
+    Neuron,
+    SimulationJob,
+    SimulationResult,
+    Strain,
+    StrainNeuron,
+)
+from neuronsimulator.store import get_stored_result, store_result
+from neuronsimulator.utils import AtlasRegistry, PeakAmplitudeIndex
 from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
+from neuronsimulator.utils import get_min_max_indices
+from wormfunconn import FunctionalAtlas
 
 
 class NeuronTests(TestCase):
@@ -18,6 +70,42 @@ class NeuronTests(TestCase):
         self.assertEqual(ADAL.name, "ADAL")
 
 
+class CacheTests(SimpleTestCase):
+    def test_byte_budget_lru_eviction(self):
+        cache = ByteBudgetLocMemCache(
+            "test-byte-budget", {"OPTIONS": {"MAX_BYTES": 1000}}
+        )
+        cache.clear()
+        for i in range(3):
+            cache.set(f"key{i}", b"x" * 300)
+        # use key0, so that key1 is the least recently used entry
+        cache.get("key0")
+        cache.set("key3", b"x" * 300)
+        self.assertIsNone(cache.get("key1"))
+        self.assertIsNotNone(cache.get("key0"))
+        self.assertIsNotNone(cache.get("key3"))
+        self.assertLessEqual(cache.total_bytes, 1000)
+        self.assertEqual(cache.evictions, 1)
+        # values larger than the budget are not stored
+        cache.set("key4", b"x" * 2000)
+        self.assertIsNone(cache.get("key4"))
+        cache.clear()
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_stimulus_cache(self):
+        stimulus_cache = StimulusCache(maxsize=2)
+        stim1 = stimulus_cache.get_or_create("key1", lambda: np.ones(10))
+        stim2 = stimulus_cache.get_or_create("key1", lambda: np.zeros(10))
+        self.assertIs(stim1, stim2)
+        self.assertFalse(stim1.flags.writeable)
+        self.assertEqual((stimulus_cache.hits, stimulus_cache.misses), (1, 1))
+        stimulus_cache.get_or_create("key2", lambda: np.ones(10))
+        stimulus_cache.get_or_create("key3", lambda: np.ones(10))
+        self.assertEqual(stimulus_cache.evictions, 1)
+        stim4 = stimulus_cache.get_or_create("key1", lambda: np.zeros(10))
+        self.assertIsNot(stim1, stim4)
+
+
 class ViewTests(TestCase):
     """
     test views as well as related form, and methods in utils
@@ -33,6 +121,74 @@ class ViewTests(TestCase):
     def test_neurons_loaded(self):
         self.assertEqual(Neuron.objects.all().count(), self.ALL_NEURONS_COUNT)
 
+    def test_neurons_synced(self):
+        """
+        reloading the neuron list only creates the neurons that changed, and only deletes
+        missing neurons with --prune
+        """
+        Neuron.objects.filter(name__in=["AVAL", "AVAR"]).delete()
+        Neuron.objects.create(name="NOTANEU")
+        out = io.StringIO()
+        call_command(
+            "load_neurons",
+            "neuronsimulator/example_data/worm_neuron_list.tsv",
+            stdout=out,
+        )
+        self.assertIn("2 created, 0 deleted", out.getvalue())
+        self.assertTrue(Neuron.objects.filter(name="NOTANEU").exists())
+
+        out = io.StringIO()
+        call_command(
+            "load_neurons",
+            "neuronsimulator/example_data/worm_neuron_list.tsv",
+            "--prune",
+            stdout=out,
+        )
+        self.assertIn("0 created, 1 deleted", out.getvalue())
+        self.assertEqual(Neuron.objects.all().count(), self.ALL_NEURONS_COUNT)
+        self.assertFalse(Neuron.objects.filter(name="NOTANEU").exists())
+
+        call_command("load_neurons", "--from-atlas", stdout=out)
+        self.assertGreaterEqual(Neuron.objects.all().count(), self.ALL_NEURONS_COUNT)
+
+    def test_strains_loaded(self):
+        """
+        neuron ids of strains loaded into the database are the same as in the atlases
+        """
+        atlas_neuron_ids = {}
+        for strain_type in ["wild-type", "unc-31"]:
+            funatlas, app_error_dict = wfc2plot().get_funatlas(strain_type)
+            atlas_neuron_ids[strain_type] = [
+                str(neu_id) for neu_id in funatlas.get_neuron_ids(stim=True)
+            ]
+        self.assertEqual(wfc2plot.get_neuron_ids_from_db("unc-31"), [])
+
+        call_command("load_strains")
+        self.assertEqual(Strain.objects.count(), 2)
+        self.assertTrue(StrainNeuron.objects.filter(stimulable=False).exists())
+        for strain_type, neuron_ids in atlas_neuron_ids.items():
+            with self.assertNumQueries(1):
+                db_neuron_ids = wfc2plot.get_neuron_ids_from_db(strain_type)
+            self.assertEqual(db_neuron_ids, neuron_ids)
+            self.assertEqual(wfc2plot().get_neuron_ids(strain_type)[0], neuron_ids)
+
+        # loading again replaces the memberships
+        count = StrainNeuron.objects.count()
+        call_command("load_strains")
+        self.assertEqual(StrainNeuron.objects.count(), count)
+
+        # the neurons loaded from another version of the atlas are not used
+        Strain.objects.filter(name="unc-31").update(atlas_sha256="0" * 64)
+        self.assertEqual(wfc2plot.get_neuron_ids_from_db("unc-31"), [])
+        self.assertEqual(
+            wfc2plot().get_neuron_ids("unc-31")[0], atlas_neuron_ids["unc-31"]
+        )
+
+        # unknown strains are not loaded with the wild-type atlas
+        with self.assertRaises(CommandError):
+            call_command("load_strains", "--strain", "typo")
+        self.assertFalse(Strain.objects.filter(name="typo").exists())
+
     def test_home_view(self):
         """
         Test the home page returns 200
@@ -40,6 +196,33 @@ class ViewTests(TestCase):
         response = self.client.get(reverse("home"))
         self.assertEqual(response.status_code, 200)
 
+    def test_home_async_view(self):
+        """
+        the async home view renders the plot from the simulation pool, and responds 503
+        when the pool is full
+        """
+        request = AsyncRequestFactory().get(reverse("home"), self.valid_data_set())
+        self.addCleanup(shutdown_executor)
+        for executor in ["thread", "process"]:
+            with self.subTest(executor=executor), self.settings(
+                SIMULATION_EXECUTOR=executor, SIMULATION_MAX_WORKERS=1
+            ):
+                shutdown_executor()
+                response = async_to_sync(views.home_async)(request)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(b"plotly-graph-div", response.content)
+                if executor == "process":
+                    # worker processes are not forked from the threaded server process
+                    self.assertEqual(
+                        get_executor()._mp_context.get_start_method(), "spawn"
+                    )
+
+        with self.settings(SIMULATION_MAX_PENDING=0):
+            shutdown_executor()
+            response = async_to_sync(views.home_async)(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
     def valid_data_set(self):
         # a set of values for form "ParamForm", which can generate response plots for both wild-type and unc-31
         valid_data_set = {
@@ -93,6 +276,22 @@ class ViewTests(TestCase):
         self.assertFalse(form3.is_valid())
         self.assertTrue(form3.errors["stim_type"] is not None)
 
+    def test_form_schema(self):
+        """
+        neuron choices are built once per strain and follow the strain of the form data
+        """
+        self.assertIs(get_form_schema("unc-31"), get_form_schema("unc-31"))
+        self.assertIs(get_form_schema("dummy"), get_form_schema("wild-type"))
+        neuron_ids, app_error_dict = wfc2plot().get_neuron_ids("unc-31")
+        valid_data_set = self.valid_data_set()
+        valid_data_set["strain_type"] = "unc-31"
+        form = ParamForm(data=valid_data_set)
+        self.assertEqual(len(form.fields["stim_neu_id"].choices), len(neuron_ids))
+        self.assertEqual(form.fields["top_n"].widget.attrs["max"], len(neuron_ids) - 1)
+        # optional field attrs are set for every form
+        self.assertEqual(form.fields["duration"].initial, 1.0)
+        self.assertIn("step", form.fields["duration"].widget.attrs)
+
     def test_reqd_params_keys(self):
         valid_data_set = self.valid_data_set()
         reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
@@ -141,6 +340,620 @@ class ViewTests(TestCase):
         self.assertEqual(len(labels_2), 3)
         self.assertEqual(app_error_dict2, {})
 
+    def test_simulation_cache(self):
+        """
+        repeat simulations are read from the cache, also for parameters given as strings
+        """
+        get_simulation_cache().clear()
+        valid_data_set = self.valid_data_set()
+        reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
+            valid_data_set
+        )
+        cache_key = wfc2plot().get_params_key(reqd_params_dict, "resp")
+        self.assertIsNone(get_simulation_cache().get(cache_key))
+        resp1, labels1, confidences1, msg1, app_error_dict1 = (
+            wfc2plot().get_resp_in_ndarray(valid_data_set)
+        )
+        self.assertIsNotNone(get_simulation_cache().get(cache_key))
+
+        # same parameters from a query string
+        str_data_set = valid_data_set.copy()
+        str_data_set["nt"] = "1000"
+        str_data_set["t_max"] = "100.0"
+        str_data_set["top_n"] = "None"
+        str_reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
+            str_data_set
+        )
+        self.assertEqual(
+            wfc2plot().get_params_key(str_reqd_params_dict, "resp"), cache_key
+        )
+        resp2, labels2, confidences2, msg2, app_error_dict2 = (
+            wfc2plot().get_resp_in_ndarray(str_data_set)
+        )
+        np.testing.assert_array_equal(resp1, resp2)
+        np.testing.assert_array_equal(labels1, labels2)
+        self.assertEqual(app_error_dict2, {})
+
+        # a different strain has its own key
+        other_data_set = valid_data_set.copy()
+        other_data_set["strain_type"] = "unc-31"
+        other_reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
+            other_data_set
+        )
+        self.assertNotEqual(
+            wfc2plot().get_params_key(other_reqd_params_dict, "resp"), cache_key
+        )
+
+    @override_settings(SIMULATION_RESULT_STORE=True)
+    def test_simulation_result_store(self):
+        """
+        simulated responses are stored once in the database and read back on a cache miss
+        """
+        get_simulation_cache().clear()
+        valid_data_set = self.valid_data_set()
+        reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
+            valid_data_set
+        )
+        cache_key = wfc2plot().get_params_key(reqd_params_dict, "resp")
+        resp1, labels1, confidences1, msg1, app_error_dict1 = (
+            wfc2plot().get_resp_in_ndarray(valid_data_set)
+        )
+        self.assertEqual(SimulationResult.objects.filter(key=cache_key).count(), 1)
+
+        # a restarted process has an empty cache
+        get_simulation_cache().clear()
+        w2p = wfc2plot()
+        resp2, labels2, confidences2, msg2, app_error_dict2 = w2p.get_resp_in_ndarray(
+            valid_data_set
+        )
+        self.assertEqual(w2p.timer.cache["store"], "hit")
+        self.assertEqual(resp2.dtype, np.float64)
+        np.testing.assert_allclose(resp1, resp2, rtol=1e-6)
+        np.testing.assert_array_equal(labels1, labels2)
+        np.testing.assert_allclose(confidences1, confidences2)
+        self.assertEqual(app_error_dict2, {})
+        self.assertIsNotNone(get_simulation_cache().get(cache_key))
+
+        # the same result is not stored twice
+        store_result(cache_key, resp1, labels1, confidences1, msg1)
+        self.assertEqual(SimulationResult.objects.filter(key=cache_key).count(), 1)
+
+    def test_simulation_result_store_limits(self):
+        """
+        the store keeps at most SIMULATION_RESULT_STORE_MAX_ROWS results and
+        SIMULATION_RESULT_STORE_MAX_BYTES, deleting the least recently used ones
+        """
+        resp = np.ones((3, 1000))
+        labels = np.array(["FLPL (0)", "I4 (1)", "I6 (2)"])
+        with self.settings(
+            SIMULATION_RESULT_STORE=True,
+            SIMULATION_RESULT_STORE_MAX_ROWS=2,
+            SIMULATION_RESULT_STORE_MAX_BYTES=0,
+        ):
+            store_result("resp:a", resp, labels, None, None)
+            store_result("resp:b", resp, labels, None, None)
+            # reading a result makes it the most recently used
+            self.assertIsNotNone(get_stored_result("resp:a"))
+            store_result("resp:c", resp, labels, None, None)
+            self.assertEqual(
+                set(SimulationResult.objects.values_list("key", flat=True)),
+                {"resp:a", "resp:c"},
+            )
+
+        size = SimulationResult.objects.get(key="resp:a").size
+        self.assertGreater(size, 0)
+        with self.settings(
+            SIMULATION_RESULT_STORE=True,
+            SIMULATION_RESULT_STORE_MAX_ROWS=0,
+            SIMULATION_RESULT_STORE_MAX_BYTES=size,
+        ):
+            store_result("resp:d", resp, labels, None, None)
+        self.assertEqual(
+            list(SimulationResult.objects.values_list("key", flat=True)), ["resp:d"]
+        )
+
+        # the store is opt-in
+        store_result("resp:e", resp, labels, None, None)
+        self.assertFalse(SimulationResult.objects.filter(key="resp:e").exists())
+
+        SimulationResult.objects.update(
+            last_accessed=timezone.now() - timedelta(days=10)
+        )
+        out = io.StringIO()
+        call_command("prune_results", "--older-than", "7", stdout=out)
+        self.assertIn("Deleted 1 simulation results, 0 left", out.getvalue())
+
+    def test_all_output_cache(self):
+        """
+        repeat parameter sets get the cached output
+        """
+        get_simulation_cache().clear()
+        valid_data_set = self.valid_data_set()
+        reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
+            valid_data_set
+        )
+        cache_key = wfc2plot().get_params_key(
+            reqd_params_dict, wfc2plot.get_plot_cache_prefix()
+        )
+        out1 = wfc2plot().get_all_output_for_plot(valid_data_set)
+        self.assertEqual(get_simulation_cache().get(cache_key), out1)
+        out2 = wfc2plot().get_all_output_for_plot(valid_data_set)
+        # only the stage timings differ
+        self.assertEqual(out1[:5], out2[:5])
+        self.assertEqual(out2.stage_timings["cache"]["plot"], "hit")
+
+        # output without a plot is not cached
+        invalid_data_set = valid_data_set.copy()
+        invalid_data_set["stim_neu_id"] = ""
+        out3 = wfc2plot().get_all_output_for_plot(invalid_data_set)
+        self.assertIsNone(out3.plot_div)
+        reqd_params_dict3, app_error_dict = wfc2plot().get_reqd_params_dict(
+            invalid_data_set
+        )
+        cache_key3 = wfc2plot().get_params_key(
+            reqd_params_dict3, wfc2plot.get_plot_cache_prefix()
+        )
+        self.assertIsNone(get_simulation_cache().get(cache_key3))
+
+    def test_stage_timings(self):
+        """
+        stage durations and cache results are on AllOutput and in the Server-Timing header
+        """
+        get_simulation_cache().clear()
+        valid_data_set = self.valid_data_set()
+        out = wfc2plot().get_all_output_for_plot(valid_data_set)
+        for stage in [
+            "params",
+            "atlas",
+            "stimulus",
+            "responses",
+            "figure",
+            "serialize",
+        ]:
+            self.assertIn(stage, out.stage_timings["stages"])
+        self.assertEqual(out.stage_timings["cache"]["plot"], "miss")
+        self.assertEqual(out.stage_timings["cache"]["resp"], "miss")
+
+        with self.assertLogs("neuronsimulator.timing", level="INFO") as logs:
+            response = self.client.get(reverse("home"), valid_data_set)
+        self.assertIn("form;dur=", response["Server-Timing"])
+        self.assertIn('plot-cache;desc="hit"', response["Server-Timing"])
+        self.assertIn("render;dur=", response["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "home")
+        self.assertEqual(record["cache"]["plot"], "hit")
+
+        response = self.client.get(reverse("load_neurons"), {"strain_type": "unc-31"})
+        self.assertIn("neuron_ids;dur=", response["Server-Timing"])
+
+    def test_metrics_view(self):
+        """
+        the metrics endpoint has the latency histograms and cache counters in Prometheus format
+        """
+        self.client.get(reverse("home"), self.valid_data_set())
+        self.client.get(reverse("load_neurons"), {"strain_type": "wild-type"})
+        self.assertEqual(reverse("metrics"), "/metrics")
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response["Content-Type"].startswith("text/plain; version=0.0.4")
+        )
+        content = response.content.decode()
+        self.assertIn("# TYPE funsim_request_duration_seconds histogram", content)
+        self.assertIn('funsim_request_duration_seconds_count{view="home"}', content)
+        self.assertIn(
+            'funsim_request_duration_seconds_count{view="load_neurons"}', content
+        )
+        self.assertIn(
+            'funsim_stage_duration_seconds_bucket{stage="responses",le="+Inf"}', content
+        )
+        self.assertIn('funsim_cache_requests_total{cache="plot",result=', content)
+        self.assertIn("funsim_stimulus_cache_requests_total", content)
+        self.assertIn("funsim_simulations_in_progress 0", content)
+
+        # local requests, e.g. from a reverse proxy, need the token too
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get(reverse("metrics"), REMOTE_ADDR="127.0.0.1")
+            self.assertEqual(response.status_code, 401)
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong"
+            )
+            self.assertEqual(response.status_code, 401)
+        with self.settings(METRICS_TOKEN=""):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ")
+            self.assertEqual(response.status_code, 404)
+
+    def test_staff_profiling(self):
+        """
+        staff users can profile the home view and download the saved profile
+        """
+        params = {**self.valid_data_set(), "stim_type": "sinusoidal", "profile": "1"}
+        # not staff: the page as usual
+        response = self.client.get(reverse("home"), params)
+        self.assertContains(response, "plotly-graph-div")
+
+        User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.login(username="staff", password="password")
+        with tempfile.TemporaryDirectory() as profile_root, self.settings(
+            PROFILE_ROOT=profile_root
+        ):
+            response = self.client.get(reverse("home"), params)
+            self.assertEqual(response["Content-Type"], "text/plain")
+            report = response.content.decode()
+            self.assertIn("cumulative", report)
+            self.assertIn("get_all_output_for_plot", report)
+            # the output of the first request is cached, the profile still simulates
+            server_timing = report.split("Server-Timing: ")[1].splitlines()[0]
+            self.assertIn("responses;dur=", server_timing)
+            self.assertIn("stimulus;dur=", server_timing)
+            self.assertNotIn("plot-cache", server_timing)
+            self.assertNotIn("resp-cache", server_timing)
+
+            download_url = report.split("Download: ")[1].split()[0]
+            response = self.client.get(urlparse(download_url).path)
+            self.assertEqual(response.status_code, 200)
+            prof_path = os.path.join(profile_root, "downloaded.prof")
+            with open(prof_path, "wb") as prof_file:
+                prof_file.write(b"".join(response.streaming_content))
+            self.assertGreater(pstats.Stats(prof_path).total_calls, 0)
+
+            response = self.client.get(reverse("profile_download", args=["db.sqlite3"]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_plot_page_conditional_get(self):
+        """
+        plot urls get an ETag and Cache-Control, and a 304 response for a matching If-None-Match
+        """
+        valid_data_set = self.valid_data_set()
+        # the first response sets the CSRF cookie, which is part of the ETag; it must not be
+        # stored by shared caches
+        response = self.client.get(reverse("home"), valid_data_set)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+        response = self.client.get(reverse("home"), valid_data_set)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+        response = self.client.get(
+            reverse("home"), valid_data_set, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(response.content, b"")
+
+        # other parameters, another strain or a job request are not matched
+        other_data_set = {**valid_data_set, "strain_type": "unc-31"}
+        response = self.client.get(
+            reverse("home"), other_data_set, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.post(reverse("home"), valid_data_set)
+        self.assertNotIn("ETag", response)
+        invalid_data_set = {**valid_data_set, "duration": ""}
+        response = self.client.get(reverse("home"), invalid_data_set)
+        self.assertNotIn("ETag", response)
+
+    def test_plot_div_size(self):
+        """
+        the plot fragment contains the figure only, plotly.js is a static file
+        """
+        valid_data_set = self.valid_data_set()
+        plot_div, resp_msg, app_error_dict = wfc2plot().get_plot_html_div(
+            valid_data_set
+        )
+        self.assertIn("Plotly.newPlot", plot_div)
+        self.assertNotIn("plotly.js v", plot_div)
+        # 3 traces of 1000 points
+        self.assertLess(len(plot_div), 200 * 1024)
+        self.assertIsNotNone(finders.find(wfc2plot.get_plotlyjs_static_path()))
+
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, wfc2plot.get_plotlyjs_static_path())
+
+    def test_plot_downsampling(self):
+        """
+        traces of large nt are decimated to the point budget, keeping their extremes
+        """
+        resp = np.sin(np.linspace(0, 20, 10001))[np.newaxis, :] * np.array([[1], [3]])
+        resp[1, 4321] = 10.0
+        indices = get_min_max_indices(resp, 1000)
+        self.assertEqual(indices.shape, (2, 1000))
+        self.assertTrue(np.all(np.diff(indices, axis=1) >= 0))
+        self.assertEqual(indices[0, 0], 0)
+        self.assertEqual(indices[0, -1], 10000)
+        for trace, kept in zip(resp, indices):
+            self.assertEqual(trace[kept].max(), trace.max())
+            self.assertEqual(trace[kept].min(), trace.min())
+        self.assertIn(4321, indices[1])
+        self.assertIsNone(get_min_max_indices(resp, 0))
+        self.assertIsNone(get_min_max_indices(resp[:, :500], 1000))
+
+        valid_data_set = self.valid_data_set()
+        valid_data_set["nt"] = 10000
+        with self.settings(PLOT_MAX_POINTS_PER_TRACE=0):
+            full_plot_div = wfc2plot().get_plot_html_div(valid_data_set)[0]
+        with self.settings(PLOT_MAX_POINTS_PER_TRACE=1000):
+            plot_div = wfc2plot().get_plot_html_div(valid_data_set)[0]
+        self.assertLess(len(plot_div), len(full_plot_div) / 5)
+
+    def test_simulate_view(self):
+        """
+        the simulate view returns responses as JSON, .npy or raw float32
+        """
+        query_string = (
+            "strain_type=wild-type&stim_type=rectangular&stim_neu_id=FLPL"
+            "&resp_neu_ids=FLPL&resp_neu_ids=I4&resp_neu_ids=I6&nt=1000"
+            "&t_max=100&top_n=None&duration=1.0"
+        )
+        url = reverse("simulate") + "?" + query_string
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["shape"], [3, 1000])
+        self.assertEqual(len(data["responses"]), 3)
+        self.assertEqual(len(data["responses"][0]), 1000)
+        self.assertEqual(len(data["labels"]), 3)
+        self.assertEqual(len(data["confidences"]), 3)
+
+        response = self.client.get(url + "&format=npy")
+        self.assertEqual(response.status_code, 200)
+        resp = np.load(io.BytesIO(response.content))
+        self.assertEqual(resp.shape, (3, 1000))
+        self.assertEqual(resp.dtype, np.dtype("<f4"))
+        self.assertEqual(json.loads(response["X-Labels"]), data["labels"])
+
+        response = self.client.get(url + "&format=f32")
+        self.assertEqual(response.status_code, 200)
+        shape = tuple(int(n) for n in response["X-Shape"].split(","))
+        resp_f32 = np.frombuffer(response.content, dtype="<f4").reshape(shape)
+        np.testing.assert_array_equal(resp_f32, resp)
+
+        # invalid input
+        response = self.client.get(url + "&format=dummy")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("simulate") + "?strain_type=dummy")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("strain_type", response.json()["errors"])
+
+    def test_export_view(self):
+        """
+        the export view streams responses as CSV, .npy or .npz files
+        """
+        query_string = (
+            "strain_type=wild-type&stim_type=rectangular&stim_neu_id=FLPL"
+            "&resp_neu_ids=FLPL&resp_neu_ids=I4&resp_neu_ids=I6&nt=3000"
+            "&t_max=300&top_n=None&duration=1.0"
+        )
+        url = reverse("export") + "?" + query_string
+        resp = np.load(
+            io.BytesIO(
+                self.client.get(
+                    reverse("simulate") + "?" + query_string + "&format=npy"
+                ).content
+            )
+        )
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2 + 3000)
+        self.assertEqual(lines[0].split(",")[0], "time")
+        self.assertEqual(len(lines[2].split(",")), 4)
+
+        response = self.client.get(url + "&format=npy")
+        self.assertTrue(response.streaming)
+        exported = np.load(io.BytesIO(b"".join(response.streaming_content)))
+        np.testing.assert_array_equal(exported, resp)
+
+        response = self.client.get(url + "&format=npz")
+        self.assertTrue(response.streaming)
+        with np.load(io.BytesIO(b"".join(response.streaming_content))) as npz:
+            np.testing.assert_array_equal(npz["resp"], resp)
+            self.assertEqual(npz["t"].shape, (3000,))
+            self.assertEqual(len(npz["labels"]), 3)
+            self.assertEqual(len(npz["confidences"]), 3)
+
+        response = self.client.get(url + "&format=xls")
+        self.assertEqual(response.status_code, 400)
+
+    def test_iter_npy_bytes(self):
+        """
+        .npy exports are streamed in chunks of at most chunk_bytes, whatever the shape
+        """
+        for arr in [
+            np.arange(3 * 1000, dtype="<f4").reshape(3, 1000),
+            np.array(["FLPL", "I4"]),
+            np.array(3.0),
+        ]:
+            chunks = list(iter_npy_bytes(arr, chunk_bytes=1000))
+            self.assertLessEqual(max(len(chunk) for chunk in chunks[1:]), 1000)
+            exported = np.load(io.BytesIO(b"".join(chunks)))
+            np.testing.assert_array_equal(exported, arr)
+
+    def test_simulate_batch_view(self):
+        """
+        the batch view simulates several stimulated neurons in one request
+        """
+        valid_data_set = self.valid_data_set()
+        stim_neu_ids = ["FLPL", "I4", "I6"]
+        url = reverse("simulate_batch")
+        body = {"params": valid_data_set, "stim_neu_ids": stim_neu_ids}
+        response = self.client.post(
+            url, json.dumps(body), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["stim_neu_id"] for r in results], stim_neu_ids)
+        for result in results:
+            self.assertEqual(result["shape"], [3, 1000])
+            self.assertEqual(result["errors"], {})
+
+        # same results as single simulations
+        resp, labels, confidences, msg, app_error_dict = wfc2plot().get_resp_in_ndarray(
+            {**valid_data_set, "stim_neu_id": "I4"}
+        )
+        np.testing.assert_allclose(results[1]["responses"], resp, rtol=1e-6)
+
+        body = {
+            "param_sets": [
+                valid_data_set,
+                {**valid_data_set, "strain_type": "unc-31"},
+            ],
+            "format": "npz",
+        }
+        response = self.client.post(
+            url, json.dumps(body), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        npz = np.load(io.BytesIO(response.content))
+        self.assertEqual(list(npz["stim_neu_ids"]), ["FLPL", "FLPL"])
+        self.assertEqual(npz["resp_0"].shape, (3, 1000))
+        self.assertEqual(npz["resp_1"].shape, (3, 1000))
+
+        # invalid input
+        body = {"params": valid_data_set, "stim_neu_ids": ["dummy"]}
+        response = self.client.post(
+            url, json.dumps(body), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_peak_amplitude_index(self):
+        """
+        top_n responses from the peak amplitude index are the same as without the index
+        """
+        valid_data_set = self.valid_data_set()
+        params_dict = {**valid_data_set, "resp_neu_ids": [], "top_n": 5}
+        reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(params_dict)
+        template_key = wfc2plot().get_stimulus_template_key(reqd_params_dict)
+
+        # responses without the index
+        funatlas, app_error_dict = wfc2plot().get_funatlas("wild-type")
+        stim, app_error_dict = wfc2plot().get_stimulus(funatlas, reqd_params_dict)
+        resp1, labels1, confidences1, msg1 = funatlas.get_responses(
+            stim, wfc2plot.t_max_to_dt(100, 1000), "FLPL", threshold=0.0, top_n=5
+        )
+
+        with tempfile.TemporaryDirectory() as index_root:
+            with self.settings(PEAK_INDEX_ROOT=index_root):
+                self.assertIsNone(
+                    PeakAmplitudeIndex.get_top_n_candidates(template_key, "FLPL", 5)
+                )
+                call_command(
+                    "build_peak_index",
+                    strains=["wild-type"],
+                    stim_types=["rectangular"],
+                    stim_neu_ids=["FLPL"],
+                )
+                candidates = PeakAmplitudeIndex.get_top_n_candidates(
+                    template_key, "FLPL", 5
+                )
+                self.assertEqual(len(candidates), 5)
+                # neurons not in the index are simulated as before
+                self.assertIsNone(
+                    PeakAmplitudeIndex.get_top_n_candidates(template_key, "I4", 5)
+                )
+                resp2, labels2, confidences2, msg2, app_error_dict2 = (
+                    wfc2plot().simulate_resp_in_ndarray(params_dict)
+                )
+
+        self.assertEqual(app_error_dict2, {})
+        resp_dict1 = wfc2plot.resp_labels_to_dict(labels1)
+        resp_dict2 = wfc2plot.resp_labels_to_dict(labels2)
+        self.assertEqual(set(resp_dict1), set(resp_dict2))
+        self.assertEqual(set(resp_dict2), set(candidates))
+        rows1 = dict(zip(resp_dict1, resp1))
+        rows2 = dict(zip(resp_dict2, resp2))
+        for neu_id in resp_dict1:
+            np.testing.assert_allclose(rows1[neu_id], rows2[neu_id])
+
+    def test_stimulus_reused(self):
+        """
+        the same stimulus is shared by neurons and strains
+        """
+        valid_data_set = self.valid_data_set()
+        funatlas1, app_error_dict = wfc2plot().get_funatlas("wild-type")
+        funatlas2, app_error_dict = wfc2plot().get_funatlas("unc-31")
+        stim1, app_error_dict1 = wfc2plot().get_stimulus(funatlas1, valid_data_set)
+        stim2, app_error_dict2 = wfc2plot().get_stimulus(funatlas2, valid_data_set)
+        self.assertIs(stim1, stim2)
+        self.assertEqual(stim1.size, 1000)
+        self.assertEqual(app_error_dict1, {})
+
+    def test_neurons_view(self):
+        """
+        neuron lists of all strains with HTTP cache validators
+        """
+        response = self.client.get(reverse("neurons"))
+        self.assertEqual(response.status_code, 200)
+        neuron_ids_by_strain = response.json()["strains"]
+        self.assertEqual(set(neuron_ids_by_strain), {"wild-type", "unc-31"})
+        neuron_ids, app_error_dict = wfc2plot().get_neuron_ids("unc-31")
+        self.assertEqual(neuron_ids_by_strain["unc-31"], list(neuron_ids))
+        self.assertIn("max-age", response["Cache-Control"])
+        etag = response["ETag"]
+
+        response = self.client.get(reverse("neurons"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # the lists are embedded in the home page
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, 'id="neuron_ids_by_strain"')
+
+    def test_neurons_view_error(self):
+        """
+        errors are neither cached nor validated with an ETag
+        """
+        wfc2plot.clear_neuron_ids_by_strain()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, self.settings(
+                MEDIA_ROOT=media_root
+            ):
+                response = self.client.get(reverse("neurons"))
+        finally:
+            wfc2plot.clear_neuron_ids_by_strain()
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_home_view_missing_atlas(self):
+        """
+        the page still renders without an ETag when the atlas of another strain is missing
+        """
+        atlas_path = os.path.join(wfc2plot.get_atlas_folder(), "wild-type.pickle")
+        wfc2plot.clear_neuron_ids_by_strain()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, self.settings(
+                MEDIA_ROOT=media_root
+            ):
+                atlas_folder = wfc2plot.get_atlas_folder()
+                os.makedirs(atlas_folder)
+                os.symlink(
+                    os.path.abspath(atlas_path),
+                    os.path.join(atlas_folder, "wild-type.pickle"),
+                )
+                response = self.client.get(reverse("home"))
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header("ETag"))
+                response = self.client.get(reverse("home"), self.valid_data_set())
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header("ETag"))
+        finally:
+            wfc2plot.clear_neuron_ids_by_strain()
+
     def test_get_url_to_params(self):
         valid_data_set = self.valid_data_set()
         reqd_params_dict, app_error_dict = wfc2plot().get_reqd_params_dict(
@@ -166,6 +979,93 @@ class ViewTests(TestCase):
             float(url_param_dict["duration"][0]), valid_data_set["duration"]
         )
 
+    def test_funatlas_loaded_once(self):
+        """
+        atlas instances are shared across calls and strains are kept apart
+        """
+        AtlasRegistry.clear()
+        folder = wfc2plot.get_atlas_folder()
+        self.assertFalse(AtlasRegistry.is_loaded(folder, "wild-type.pickle"))
+        funatlas1, app_error_dict1 = wfc2plot().get_funatlas("wild-type")
+        self.assertTrue(AtlasRegistry.is_loaded(folder, "wild-type.pickle"))
+        funatlas2, app_error_dict2 = wfc2plot().get_funatlas("wild-type")
+        funatlas3, app_error_dict3 = wfc2plot().get_funatlas("unc-31")
+        self.assertIs(funatlas1, funatlas2)
+        self.assertIsNot(funatlas1, funatlas3)
+        self.assertEqual(app_error_dict1, {})
+        self.assertEqual(app_error_dict3, {})
+
+    def test_mmap_atlas_layout(self):
+        """
+        the memory-mapped layout gives the same responses as the pickle it was converted from,
+        also for atlases whose kernels (ec) are an object array
+        """
+        folder = wfc2plot.get_atlas_folder()
+        for fname in ["mock.pickle", "wild-type.pickle"]:
+            with self.subTest(fname=fname), tempfile.TemporaryDirectory() as output_dir:
+                call_command(
+                    "convert_atlas", fname, output_dir=output_dir, stdout=io.StringIO()
+                )
+                layout_dir = AtlasRegistry.get_layout_dir(output_dir, fname)
+                manifest = AtlasRegistry.read_layout_manifest(layout_dir)
+                self.assertIsNotNone(manifest)
+                pickle_atlas = FunctionalAtlas.from_file(folder, fname)
+                mmap_atlas = AtlasRegistry.load_atlas_layout(layout_dir)
+                self.assertEqual(sorted(vars(mmap_atlas)), sorted(vars(pickle_atlas)))
+
+                ec = getattr(pickle_atlas, "ec", None)
+                if ec is not None:
+                    # the kernels are not pickled, and are rebuilt when indexed
+                    self.assertIn("ec", manifest["kernels"])
+                    self.assertNotIn("ec", manifest["object_attrs"])
+                    for pos, kernel in np.ndenumerate(ec):
+                        mmap_kernel = mmap_atlas.ec[pos]
+                        if kernel is None:
+                            self.assertIsNone(mmap_kernel)
+                        else:
+                            self.assertIs(type(mmap_kernel), type(kernel))
+                            self.assertEqual(mmap_kernel.exp, kernel.exp)
+
+                neuron_ids = pickle_atlas.get_neuron_ids(stim=True)
+                self.assertEqual(
+                    list(mmap_atlas.get_neuron_ids(stim=True)), list(neuron_ids)
+                )
+                nt = 1000
+                dt = wfc2plot.t_max_to_dt(100, nt)
+                stim = pickle_atlas.get_standard_stimulus(
+                    nt, dt=dt, stim_type="rectangular", duration=1.0
+                )
+                for stim_neu_id in neuron_ids[:3]:
+                    pickle_out = pickle_atlas.get_responses(
+                        stim, dt, stim_neu_id, threshold=0.0, top_n=10
+                    )
+                    mmap_out = mmap_atlas.get_responses(
+                        stim, dt, stim_neu_id, threshold=0.0, top_n=10
+                    )
+                    resp1, labels1, confidences1, msg1 = pickle_out
+                    resp2, labels2, confidences2, msg2 = mmap_out
+                    np.testing.assert_array_equal(resp1, resp2)
+                    np.testing.assert_array_equal(labels1, labels2)
+                    np.testing.assert_array_equal(confidences1, confidences2)
+                    self.assertEqual(msg1, msg2)
+
+    def test_stale_atlas_layout(self):
+        """
+        a layout of another format version without its pickle is reported as a missing atlas
+        """
+        with tempfile.TemporaryDirectory() as media_root, self.settings(
+            MEDIA_ROOT=media_root
+        ):
+            folder = wfc2plot.get_atlas_folder()
+            layout_dir = AtlasRegistry.get_layout_dir(folder, "wild-type.pickle")
+            os.makedirs(layout_dir)
+            with open(os.path.join(layout_dir, AtlasRegistry.manifest_fname), "w") as f:
+                json.dump({"format_version": 1, "source_sha256": "0" * 64}, f)
+            self.assertFalse(AtlasRegistry.has_atlas(folder, "wild-type.pickle"))
+            funatlas, app_error_dict = wfc2plot().get_funatlas("wild-type")
+        self.assertIsNone(funatlas)
+        self.assertIn("atlas_file_error", app_error_dict)
+
     def test_get_stim_type_choice(self):
         stim_type_choice = wfc2plot().get_stim_type_choice()
         sel_choice = ("delta", "delta")
@@ -225,3 +1125,174 @@ class ViewTests(TestCase):
         self.assertFalse(plot_div is None)
         self.assertEqual(url_query_string, exp_url_query_string)
         self.assertEqual(len(app_error_dict), 0)
+
+
+class JobTests(TransactionTestCase):
+    # the results of jobs are saved by another thread, so the test data must be committed
+
+    def tearDown(self):
+        shutdown_job_executor()
+
+    def test_simulation_job(self):
+        """
+        a job request redirects to the job page, which redirects to the plot once done
+        """
+        get_simulation_cache().clear()
+        params = {"stim_neu_id": "FLPL", "resp_neu_ids": ["FLPL", "I4"], "job": "1"}
+        response = self.client.get(reverse("home"), params)
+        self.assertEqual(response.status_code, 302)
+        job = SimulationJob.objects.get()
+        self.assertEqual(response.url, reverse("job", args=[job.id]))
+        status_url = reverse("job_status", args=[job.id])
+
+        for i in range(120):
+            status = self.client.get(status_url).json()
+            if status["status"] != SimulationJob.PENDING:
+                break
+            time.sleep(0.5)
+        self.assertEqual(status["status"], SimulationJob.DONE)
+
+        response = self.client.get(reverse("job", args=[job.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(f"job_id={job.id}", response.url)
+        response = self.client.get(response.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"plotly-graph-div", response.content)
+
+        # the output of a job is only shown for the parameters it simulated
+        request = RequestFactory().get(reverse("home"), {"job_id": str(job.id)})
+        self.assertIsNotNone(views.get_job_output(request, job.params))
+        other_params = {**job.params, "resp_neu_ids": ["FLPL"]}
+        self.assertIsNone(views.get_job_output(request, other_params))
+
+    @override_settings(SIMULATION_JOBS=True)
+    def test_job_not_needed(self):
+        """
+        pages without a neuron to simulate or with a cached output are not run as jobs
+        """
+        get_simulation_cache().clear()
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(SimulationJob.objects.exists())
+
+        params = {"stim_neu_id": "FLPL", "resp_neu_ids": ["FLPL", "I4"]}
+        with self.settings(SIMULATION_JOBS=False):
+            response = self.client.get(reverse("home"), params)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("home"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"plotly-graph-div", response.content)
+        self.assertFalse(SimulationJob.objects.exists())
+
+    def test_expired_job(self):
+        job = SimulationJob.objects.create(params={})
+        response = self.client.get(reverse("job", args=[job.id]))
+        self.assertContains(response, "Simulation running")
+        SimulationJob.objects.filter(id=job.id).update(
+            created=timezone.now() - timedelta(seconds=settings.SIMULATION_JOB_TIMEOUT)
+        )
+        status = self.client.get(reverse("job_status", args=[job.id])).json()
+        self.assertEqual(status["status"], SimulationJob.FAILED)
+
+
+class WarmCacheTests(TestCase):
+    def test_warm_cache(self):
+        """
+        the command refuses a process-local cache without the result store or --force and
+        resumes from its state
+        """
+        with tempfile.TemporaryDirectory() as state_dir:
+            state = os.path.join(state_dir, "warm_cache.state")
+            args = ["--strain", "unc-31", "--neuron", "FLPL", "--neuron", "I4"]
+            with self.settings(SIMULATION_RESULT_STORE=False):
+                with self.assertRaises(CommandError):
+                    call_command("warm_cache", *args, state=state, stdout=io.StringIO())
+
+            out = io.StringIO()
+            call_command(
+                "warm_cache", *args, "--force", state=state, workers=1, stdout=out
+            )
+            self.assertIn("2 to warm", out.getvalue())
+            with open(state) as state_file:
+                self.assertEqual(len(state_file.read().split()), 2)
+
+            out = io.StringIO()
+            call_command(
+                "warm_cache", *args, "--force", state=state, workers=1, stdout=out
+            )
+            self.assertIn("0 to warm", out.getvalue())
+
+            out = io.StringIO()
+            call_command(
+                "warm_cache",
+                *args,
+                "--force",
+                "--grid",
+                "nt=1000,2000",
+                state=state,
+                workers=1,
+                stdout=out,
+            )
+            self.assertIn("4 parameter sets", out.getvalue())
+
+
+class OrphanedJobTests(TestCase):
+    def test_orphaned_job(self):
+        """
+        pending jobs of a server process that is gone are failed without waiting for the
+        timeout, jobs of live processes are kept
+        """
+        finished = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished.wait()
+        orphaned_job = SimulationJob.objects.create(
+            params={}, worker=get_worker_id(finished.pid)
+        )
+        running_job = SimulationJob.objects.create(params={}, worker=get_worker_id())
+        status = self.client.get(reverse("job_status", args=[orphaned_job.id])).json()
+        self.assertEqual(status["status"], SimulationJob.FAILED)
+        self.assertEqual(fail_orphaned_jobs(), 0)
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, SimulationJob.PENDING)
+
+        orphaned_job = SimulationJob.objects.create(
+            params={}, worker=get_worker_id(finished.pid)
+        )
+        self.assertEqual(fail_orphaned_jobs(), 1)
+        orphaned_job.refresh_from_db()
+        self.assertEqual(orphaned_job.status, SimulationJob.FAILED)
+
+
+class BenchmarkTests(TestCase):
+    # the pipeline benchmark is tagged, run it with: python manage.py test --tag benchmark
+    # set BENCHMARK_BASELINE to the results of "manage.py benchmark" to fail on regressions
+
+    def test_compare_to_baseline(self):
+        baseline = {"cases": {"nt=1000,n_resp=1": {"stimulus": {"min_ms": 10.0}}}}
+        results = {"cases": {"nt=1000,n_resp=1": {"stimulus": {"min_ms": 13.0}}}}
+        self.assertEqual(compare_to_baseline(results, baseline, 0.25), [])
+        results["cases"]["nt=1000,n_resp=1"]["stimulus"]["min_ms"] = 14.0
+        regressions = compare_to_baseline(results, baseline, 0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0]["stage"], "stimulus")
+        # cases missing from the baseline are not compared
+        self.assertEqual(compare_to_baseline(results, {"cases": {}}, 0.25), [])
+
+    @tag("benchmark")
+    def test_pipeline_stages(self):
+        results = run_benchmark(
+            nt_list=[1000, 10000], n_resp_list=[10], top_n_list=[10], repeat=3
+        )
+        self.assertEqual(len(results["cases"]), 4)
+        self.assertEqual(results["atlas_format"], "pickle")
+        for stages in results["cases"].values():
+            self.assertEqual(list(stages), STAGES)
+            for timing in stages.values():
+                self.assertGreater(timing["median_ms"], 0)
+                self.assertLessEqual(timing["min_ms"], timing["median_ms"])
+
+        baseline_path = os.environ.get("BENCHMARK_BASELINE")
+        if baseline_path:
+            regressions = compare_to_baseline(
+                results, read_results(baseline_path), 0.25
+            )
+            self.assertEqual(regressions, [])
@@ -0,0 +1,98 @@
+import json
+import time
+from contextlib import contextmanager
+
+from neuronsimulator.metrics import CACHE_REQUESTS, REQUEST_DURATION, STAGE_DURATION
+
+
+class StageTimer:
+    """
+    records how long the stages of a request take (in milliseconds, added up when a stage
+    runs more than once) and whether caches were hit, e.g.
+        timer = StageTimer()
+        with timer.stage("atlas"):
+            ...
+        timer.cache_result("resp", hit=True)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.cache = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def cache_result(self, name, hit):
+        """
+        record the result of a cache lookup, also counted in the metrics
+        """
+        result = "hit" if hit else "miss"
+        self.cache[name] = result
+        CACHE_REQUESTS.inc(cache=name, result=result)
+
+    def as_dict(self):
+        """
+        stage timings and cache results as JSON-serializable values (see AllOutput)
+        """
+        return {
+            "stages": {name: round(ms, 3) for name, ms in self.stages.items()},
+            "cache": dict(self.cache),
+        }
+
+    def update(self, stage_timings):
+        """
+        add the stage timings of as_dict(), e.g. from another timer or process
+        """
+        if not stage_timings:
+            return
+        for name, ms in stage_timings.get("stages", {}).items():
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+        self.cache.update(stage_timings.get("cache", {}))
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def get_server_timing(self):
+        """
+        value of the Server-Timing header, e.g. 'atlas;dur=1.2, resp-cache;desc="hit", total;dur=9.8'
+        """
+        metrics = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        metrics += [
+            f'{name}-cache;desc="{state}"' for name, state in self.cache.items()
+        ]
+        metrics.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(metrics)
+
+    def log(self, logger, view_name, **fields):
+        """
+        write the timings as one JSON log line
+        """
+        record = {
+            "event": "stage_timings",
+            "view": view_name,
+            **fields,
+            **self.as_dict(),
+            "total_ms": round(self.total_ms(), 3),
+        }
+        logger.info(json.dumps(record, sort_keys=True, default=str))
+
+    def observe(self, view_name):
+        """
+        add the request and its stages to the latency histograms of the metrics
+        """
+        REQUEST_DURATION.observe(self.total_ms() / 1000, view=view_name)
+        for name, ms in self.stages.items():
+            STAGE_DURATION.observe(ms / 1000, stage=name)
+
+    def add_to_response(self, response, logger, view_name, **fields):
+        response["Server-Timing"] = self.get_server_timing()
+        self.log(logger, view_name, status=response.status_code, **fields)
+        self.observe(view_name)
+        return response
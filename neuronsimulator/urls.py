@@ -1,7 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from neuronsimulator import views
 
 urlpatterns = [
-    path("", views.home, name="home"),
+    path(
+        "",
+        views.home_async if settings.ASYNC_SIMULATION else views.home,
+        name="home",
+    ),
+    path("job/<uuid:job_id>/", views.job, name="job"),
+    path("job/<uuid:job_id>/status/", views.job_status, name="job_status"),
     path("load_neurons/", views.load_neurons, name="load_neurons"),
+    path("neurons/", views.neurons, name="neurons"),
+    path("profiles/<str:fname>", views.profile_download, name="profile_download"),
+    path("simulate/", views.simulate, name="simulate"),
+    path("export/", views.export, name="export"),
+    path("simulate_batch/", views.simulate_batch, name="simulate_batch"),
 ]
@@ -1,15 +1,522 @@
+import hashlib
+import importlib
+import json
+import logging
 import os
+import pickle
 import re
+import tempfile
+import threading
 from collections import namedtuple
 from urllib.parse import urlencode
 
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import wormfunconn as wfc
 from django.conf import settings
-from plotly.offline import plot
+from django.db import DatabaseError
+from neuronsimulator.cache import StimulusCache, get_simulation_cache
+from neuronsimulator.metrics import ATLAS_LOADS, SIMULATIONS_IN_PROGRESS
+from neuronsimulator.models import StrainNeuron
+from neuronsimulator.store import get_stored_result, has_stored_result, store_result
+from neuronsimulator.timing import StageTimer
+from plotly.offline import get_plotlyjs_version, plot
 from wormfunconn import FunctionalAtlas
 
+logger = logging.getLogger(__name__)
+
+# stimulus waveforms shared by all requests of the process
+stimulus_cache = StimulusCache(settings.STIMULUS_CACHE_SIZE)
+
+
+def get_file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_min_max_indices(resp, max_points):
+    """
+    get the indices of the samples kept when decimating each trace of resp (n_traces, nt) to
+    at most max_points samples: the trace is split into equal buckets and the minimum and the
+    maximum of each bucket are kept in time order, so peaks keep their amplitude and shape at
+    the plot's resolution; the first and last samples are always kept
+    return None if no decimation is needed (nt <= max_points or max_points <= 0)
+    """
+    n_traces, nt = resp.shape
+    if max_points <= 0 or nt <= max_points:
+        return None
+    n_buckets = max((max_points - 2) // 2, 1)
+    bucket_size = -(-nt // n_buckets)
+    # pad the last bucket with the last sample, padded indices are clipped back to it
+    padded = np.pad(resp, ((0, 0), (0, n_buckets * bucket_size - nt)), mode="edge")
+    buckets = padded.reshape(n_traces, n_buckets, bucket_size)
+    offsets = np.arange(n_buckets)[np.newaxis, :, np.newaxis] * bucket_size
+    min_max = np.stack([buckets.argmin(axis=-1), buckets.argmax(axis=-1)], axis=-1)
+    indices = np.sort(min_max + offsets, axis=-1).reshape(n_traces, -1)
+    indices = np.minimum(indices, nt - 1)
+    first = np.zeros((n_traces, 1), dtype=indices.dtype)
+    last = np.full((n_traces, 1), nt - 1, dtype=indices.dtype)
+    return np.concatenate([first, indices, last], axis=1)
+
+
+# keys of the terms of an exponential convolution kernel (ExponentialConvolution_min), whose
+# only attribute exp is a list of branches, each a list of terms
+KERNEL_TERM_KEYS = ["g", "factor", "power_t", "branch"]
+
+
+def flatten_kernels(kernels):
+    """
+    flatten an object array of exponential convolution kernels (or None) to numeric arrays:
+        index: kernel number of each cell, -1 for None
+        kernel_offsets: branches of kernel k are kernel_offsets[k]:kernel_offsets[k + 1]
+        branch_offsets: terms of branch b are branch_offsets[b]:branch_offsets[b + 1]
+        g, factor, power_t, branch: the terms
+    return (kernel class, dict of arrays), None if the array holds anything else
+    """
+    kernel_cls = None
+    index = np.full(kernels.shape, -1, dtype=np.int64)
+    kernel_offsets = [0]
+    branch_offsets = [0]
+    terms = {key: [] for key in KERNEL_TERM_KEYS}
+    for pos, kernel in np.ndenumerate(kernels):
+        if kernel is None:
+            continue
+        if kernel_cls is None:
+            kernel_cls = type(kernel)
+        if type(kernel) is not kernel_cls or set(vars(kernel)) != {"exp"}:
+            return None
+        for kernel_branch in kernel.exp:
+            for term in kernel_branch:
+                if set(term) != set(KERNEL_TERM_KEYS):
+                    return None
+                if not isinstance(term["power_t"], (int, np.integer)) or not (
+                    isinstance(term["branch"], (int, np.integer))
+                ):
+                    return None
+                for key in KERNEL_TERM_KEYS:
+                    terms[key].append(term[key])
+            branch_offsets.append(len(terms["g"]))
+        index[pos] = len(kernel_offsets) - 1
+        kernel_offsets.append(len(branch_offsets) - 1)
+    if kernel_cls is None:
+        return None
+    return kernel_cls, {
+        "index": index,
+        "kernel_offsets": np.array(kernel_offsets, dtype=np.int64),
+        "branch_offsets": np.array(branch_offsets, dtype=np.int64),
+        "g": np.array(terms["g"], dtype=np.float64),
+        "factor": np.array(terms["factor"], dtype=np.float64),
+        "power_t": np.array(terms["power_t"], dtype=np.int64),
+        "branch": np.array(terms["branch"], dtype=np.int64),
+    }
+
+
+class LazyKernelArray:
+    """
+    read-only stand-in for an object array of kernels flattened by flatten_kernels: a kernel is
+    built from the (memory-mapped) arrays the first time it is indexed, e.g. ec[i, j]
+    indexing with slices or arrays returns an object array of the selected kernels, and
+    np.asarray builds all of them
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, kernel_cls, arrays):
+        self.kernel_cls = kernel_cls
+        self.arrays = arrays
+        self.shape = arrays["index"].shape
+        self.ndim = len(self.shape)
+        self._kernels = {}
+
+    def get_kernel(self, k):
+        if k < 0:
+            return None
+        kernel = self._kernels.get(k)
+        if kernel is None:
+            arrays = self.arrays
+            exp = []
+            kernel_end = arrays["kernel_offsets"][k + 1]
+            for b in range(arrays["kernel_offsets"][k], kernel_end):
+                branch_end = arrays["branch_offsets"][b + 1]
+                exp.append(
+                    [
+                        {
+                            "g": float(arrays["g"][t]),
+                            "factor": float(arrays["factor"][t]),
+                            "power_t": int(arrays["power_t"][t]),
+                            "branch": int(arrays["branch"][t]),
+                        }
+                        for t in range(arrays["branch_offsets"][b], branch_end)
+                    ]
+                )
+            # same as unpickling: create the instance without calling __init__
+            kernel = self.kernel_cls.__new__(self.kernel_cls)
+            kernel.__dict__["exp"] = exp
+            self._kernels[k] = kernel
+        return kernel
+
+    def get_kernels(self, index):
+        kernels = np.empty(index.shape, dtype=object)
+        for pos, k in np.ndenumerate(index):
+            kernels[pos] = self.get_kernel(int(k))
+        return kernels
+
+    def __getitem__(self, key):
+        index = self.arrays["index"][key]
+        if np.ndim(index) == 0:
+            return self.get_kernel(int(index))
+        return self.get_kernels(index)
+
+    def __array__(self, dtype=None, copy=None):
+        kernels = self.get_kernels(self.arrays["index"])
+        return kernels if dtype is None else kernels.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other):
+        return np.asarray(self) == other
+
+    def __ne__(self, other):
+        return np.asarray(self) != other
+
+    __hash__ = None
+
+
+class AtlasRegistry:
+    """
+    process-wide registry of FunctionalAtlas instances
+    each atlas file is loaded once per process and the instance is then shared by all
+    callers (views, forms, management commands); loading is guarded by a per-file lock so
+    concurrent first requests for the same strain do not load the file twice
+
+    an atlas pickle can be converted (manage.py convert_atlas) to a memory-mapped layout:
+    a folder named after the pickle holding one .npy file per numeric array, the kernels
+    (e.g. ec) flattened to numeric .npy files, a pickle with the remaining attributes and a
+    JSON manifest. The layout is used when it matches the pickle, otherwise the pickle is
+    loaded as before.
+    """
+
+    manifest_fname = "manifest.json"
+    objects_fname = "objects.pickle"
+    layout_format_version = 2
+
+    _atlases = {}
+    _versions = {}
+    _locks = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def _get_lock(cls, path):
+        with cls._registry_lock:
+            return cls._locks.setdefault(path, threading.Lock())
+
+    @classmethod
+    def get_atlas(cls, folder, fname):
+        """
+        return the shared FunctionalAtlas instance for an atlas file, loading it on first use
+        """
+        path = os.path.join(folder, fname)
+        funatlas = cls._atlases.get(path)
+        if funatlas is None:
+            with cls._get_lock(path):
+                # another thread may have loaded the atlas while we were waiting
+                funatlas = cls._atlases.get(path)
+                if funatlas is None:
+                    funatlas = cls.load_atlas(folder, fname)
+                    cls._atlases[path] = funatlas
+                    ATLAS_LOADS.inc(atlas=fname)
+        return funatlas
+
+    @classmethod
+    def is_loaded(cls, folder, fname):
+        """
+        whether the atlas file was already loaded by this process
+        """
+        return os.path.join(folder, fname) in cls._atlases
+
+    @classmethod
+    def has_atlas(cls, folder, fname):
+        """
+        whether an atlas file can be loaded: its pickle or an up-to-date layout exists
+        """
+        if os.path.isfile(os.path.join(folder, fname)):
+            return True
+        return cls.read_layout_manifest(cls.get_layout_dir(folder, fname)) is not None
+
+    @classmethod
+    def get_atlas_version(cls, folder, fname):
+        """
+        identify the content of an atlas: the sha256 of its pickle, or of the pickle the
+        memory-mapped layout was converted from; None if neither exists
+        """
+        path = os.path.join(folder, fname)
+        version = cls._versions.get(path)
+        if version is None:
+            if os.path.isfile(path):
+                version = get_file_sha256(path)
+            else:
+                manifest = cls.read_layout_manifest(cls.get_layout_dir(folder, fname))
+                if manifest is not None:
+                    version = manifest["source_sha256"]
+            if version is not None:
+                cls._versions[path] = version
+        return version
+
+    @classmethod
+    def get_layout_dir(cls, folder, fname):
+        """
+        folder of the memory-mapped layout for an atlas file, e.g. atlas/wild-type/
+        """
+        return os.path.join(folder, os.path.splitext(fname)[0])
+
+    @classmethod
+    def read_layout_manifest(cls, layout_dir):
+        manifest_path = os.path.join(layout_dir, cls.manifest_fname)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != cls.layout_format_version:
+            return None
+        return manifest
+
+    @classmethod
+    def load_atlas(cls, folder, fname):
+        """
+        load an atlas from its memory-mapped layout if it is up to date, otherwise from the pickle
+        """
+        path = os.path.join(folder, fname)
+        layout_dir = cls.get_layout_dir(folder, fname)
+        manifest = cls.read_layout_manifest(layout_dir)
+        if manifest is not None:
+            if not os.path.isfile(path):
+                return cls.load_atlas_layout(layout_dir, manifest)
+            if manifest["source_sha256"] == cls.get_atlas_version(folder, fname):
+                return cls.load_atlas_layout(layout_dir, manifest)
+            logger.warning(
+                "Memory-mapped layout %s is out of date, loading %s instead; "
+                "run 'manage.py convert_atlas' to update it",
+                layout_dir,
+                path,
+            )
+        return FunctionalAtlas.from_file(folder, fname)
+
+    @classmethod
+    def load_atlas_layout(cls, layout_dir, manifest=None):
+        """
+        create a FunctionalAtlas from a memory-mapped layout
+        numeric arrays are opened read-only with np.load(mmap_mode="r"), so their pages are
+        only read when used and are shared between processes through the OS page cache
+        """
+        if manifest is None:
+            manifest = cls.read_layout_manifest(layout_dir)
+        with open(os.path.join(layout_dir, manifest["objects"]), "rb") as f:
+            attrs = pickle.load(f)
+        for attr_name, array_info in manifest["arrays"].items():
+            attrs[attr_name] = np.load(
+                os.path.join(layout_dir, array_info["file"]), mmap_mode="r"
+            )
+        for attr_name, kernels_info in manifest["kernels"].items():
+            module_name, cls_name = kernels_info["class"].rsplit(".", 1)
+            kernel_cls = getattr(importlib.import_module(module_name), cls_name)
+            arrays = {
+                name: np.load(
+                    os.path.join(layout_dir, array_info["file"]), mmap_mode="r"
+                )
+                for name, array_info in kernels_info["arrays"].items()
+            }
+            attrs[attr_name] = LazyKernelArray(kernel_cls, arrays)
+        # same as unpickling: create the instance without calling __init__
+        funatlas = FunctionalAtlas.__new__(FunctionalAtlas)
+        funatlas.__dict__.update(attrs)
+        return funatlas
+
+    @classmethod
+    def save_atlas_layout(cls, funatlas, layout_dir, source_path):
+        """
+        write the memory-mapped layout of an atlas
+        arrays with a fixed-size dtype are written as uncompressed .npy files, as are the
+        kernels of object arrays of exponential convolutions (see flatten_kernels); other
+        object arrays and attributes are pickled together. Files are written under temporary
+        names and renamed into place, so processes that have the old files mapped are
+        unaffected.
+        """
+        os.makedirs(layout_dir, exist_ok=True)
+        arrays = {}
+        kernels = {}
+        objects = {}
+        for attr_name, value in vars(funatlas).items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                arrays[attr_name] = value
+                continue
+            if isinstance(value, np.ndarray):
+                flat_kernels = flatten_kernels(value)
+                if flat_kernels is not None:
+                    kernels[attr_name] = flat_kernels
+                    continue
+            objects[attr_name] = value
+
+        def write_file(fname, write):
+            fd, tmp_path = tempfile.mkstemp(dir=layout_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(layout_dir, fname))
+
+        manifest = {
+            "format_version": cls.layout_format_version,
+            "source": os.path.basename(source_path),
+            "source_sha256": get_file_sha256(source_path),
+            "objects": cls.objects_fname,
+            "object_attrs": sorted(objects),
+            "arrays": {},
+            "kernels": {},
+        }
+
+        def write_array(array_fname, value):
+            write_file(array_fname, lambda f: np.save(f, np.ascontiguousarray(value)))
+            return {
+                "file": array_fname,
+                "dtype": value.dtype.str,
+                "shape": list(value.shape),
+            }
+
+        for attr_name, value in arrays.items():
+            manifest["arrays"][attr_name] = write_array(attr_name + ".npy", value)
+        for attr_name, (kernel_cls, kernel_arrays) in kernels.items():
+            manifest["kernels"][attr_name] = {
+                "class": f"{kernel_cls.__module__}.{kernel_cls.__qualname__}",
+                "arrays": {
+                    name: write_array(f"{attr_name}-{name}.npy", value)
+                    for name, value in kernel_arrays.items()
+                },
+            }
+        write_file(
+            cls.objects_fname,
+            lambda f: pickle.dump(objects, f, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+        # the manifest is written last, so an incomplete layout is never used
+        write_file(
+            cls.manifest_fname,
+            lambda f: f.write(json.dumps(manifest, indent=2).encode()),
+        )
+        return manifest
+
+    @classmethod
+    def clear(cls):
+        """
+        drop all loaded atlases, e.g. after atlas files were replaced
+        """
+        with cls._registry_lock:
+            cls._atlases.clear()
+            cls._versions.clear()
+            cls._locks.clear()
+
+
+class PeakAmplitudeIndex:
+    """
+    peak absolute amplitude of the response of every neuron to the stimulation of every neuron,
+    for one strain (atlas version) and one stimulus template (stim_type, nt, t_max and stim kwargs)
+    indexes are built by manage.py build_peak_index and used for top_n requests: the top_n
+    candidates are picked with np.argpartition, so only top_n responses are simulated instead of
+    the responses of all neurons
+    """
+
+    _indexes = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_index_folder():
+        return settings.PEAK_INDEX_ROOT
+
+    @classmethod
+    def get_index_path(cls, template_key):
+        # template_key is "peak:<sha256>", see WormfunconnToPlot.get_stimulus_template_key
+        return os.path.join(
+            cls.get_index_folder(), template_key.replace(":", "-") + ".npz"
+        )
+
+    @classmethod
+    def load(cls, template_key):
+        """
+        get an index as a dict with stim_neu_ids, resp_neu_ids and peaks, None if not built
+        """
+        path = cls.get_index_path(template_key)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        # a rebuilt index file is loaded again
+        index = cls._indexes.get((path, mtime_ns))
+        if index is None:
+            with np.load(path) as npz:
+                index = {
+                    "stim_neu_ids": {
+                        str(neu_id): i for i, neu_id in enumerate(npz["stim_neu_ids"])
+                    },
+                    "resp_neu_ids": npz["resp_neu_ids"],
+                    "peaks": npz["peaks"],
+                }
+            with cls._lock:
+                # drop older versions of the same index file
+                for key in [key for key in cls._indexes if key[0] == path]:
+                    del cls._indexes[key]
+                cls._indexes[(path, mtime_ns)] = index
+        return index
+
+    @classmethod
+    def save(cls, template_key, stim_neu_ids, resp_neu_ids, peaks):
+        """
+        write an index; peaks[i, j] is the peak amplitude of resp_neu_ids[j] when stimulating
+        stim_neu_ids[i], NaN for responses that get_responses does not return
+        """
+        path = cls.get_index_path(template_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                stim_neu_ids=np.array(stim_neu_ids, dtype=str),
+                resp_neu_ids=np.array(resp_neu_ids, dtype=str),
+                peaks=np.asarray(peaks, dtype=np.float32),
+            )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def get_top_n_candidates(cls, template_key, stim_neu_id, top_n):
+        """
+        get the top_n neurons with the largest peak amplitude for a stimulated neuron,
+        None if there is no index for the stimulus template or the neuron
+        """
+        index = cls.load(template_key)
+        if index is None or stim_neu_id not in index["stim_neu_ids"]:
+            return None
+        row = index["peaks"][index["stim_neu_ids"][stim_neu_id]]
+        valid = np.flatnonzero(~np.isnan(row))
+        if valid.size == 0:
+            return None
+        if top_n < valid.size:
+            top = np.argpartition(-row[valid], top_n - 1)[:top_n]
+            valid = valid[top]
+        return [str(neu_id) for neu_id in index["resp_neu_ids"][valid]]
+
+
+# all output for a neural response plot, defined at module level so that it can be pickled
+AllOutput = namedtuple(
+    "AllOutput",
+    "plot_div, resp_msg, url_query_string, code_snippet, app_error_dict, stage_timings",
+    # stage_timings: StageTimer.as_dict() of the request that got the output
+    defaults=[None],
+)
+
 
 class WormfunconnToPlot:
     """
@@ -18,6 +525,19 @@ class WormfunconnToPlot:
     capture error in each step and then log it to a dictionary (app_error_dict) in output
     """
 
+    # cache key prefix for AllOutput, change it when the rendered output changes
+    plot_cache_prefix = "plot-v4"
+
+    # see get_neuron_ids_by_strain
+    _neuron_ids_by_strain = None
+
+    def __init__(self, timer=None, bypass_cache=False):
+        # stage durations and cache results of the calls on this instance
+        self.timer = timer if timer is not None else StageTimer()
+        # compute everything again instead of reading the plot, result, store and stimulus
+        # caches (e.g. to profile a request), the results are still saved
+        self.bypass_cache = bypass_cache
+
     @classmethod
     def get_stim_type_list(cls):
         """
@@ -85,27 +605,57 @@ class WormfunconnToPlot:
 
         return form_opt_field_dict
 
-    def get_funatlas(self, strain_type):
-        self.strain_type = strain_type
-        # Get atlas folder and file name
-        folder = os.path.join(settings.MEDIA_ROOT, "atlas/")
+    @staticmethod
+    def get_plotlyjs_static_path():
+        """
+        path of the plotly.js bundle under static/, named with the plotly.js version of the
+        installed plotly package; a new version gets a new URL, so it can be cached indefinitely
+        """
+        return f"js/plotly-{get_plotlyjs_version()}.min.js"
+
+    @staticmethod
+    def get_atlas_folder():
+        return os.path.join(settings.MEDIA_ROOT, "atlas/")
+
+    @staticmethod
+    def get_atlas_fname(strain_type):
+        """
+        get the atlas file name for a strain; unknown strains fall back to wild-type
+        """
         if strain_type == "wild-type":
             fname = "wild-type.pickle"
         elif strain_type == "unc-31":
             fname = "unc-31.pickle"
         else:
             fname = "wild-type.pickle"
+        return fname
+
+    def get_funatlas(self, strain_type):
+        self.strain_type = strain_type
+        # Get atlas folder and file name
+        folder = self.get_atlas_folder()
+        fname = self.get_atlas_fname(strain_type)
 
         app_error_dict = {}
 
-        # Create FunctionalAtlas instance from file
-        if os.path.isfile(os.path.join(folder, fname)):
-            funatlas = FunctionalAtlas.from_file(folder, fname)
+        # Get the shared FunctionalAtlas instance, loading it from file on first use
+        if AtlasRegistry.has_atlas(folder, fname):
+            self.timer.cache_result("atlas", AtlasRegistry.is_loaded(folder, fname))
+            with self.timer.stage("atlas"):
+                funatlas = AtlasRegistry.get_atlas(folder, fname)
         else:
             funatlas = None
             app_error_dict["atlas_file_error"] = "Input Atlas file was not found"
         return funatlas, app_error_dict
 
+    def get_atlas_version(self, strain_type):
+        """
+        get the version (content hash) of the atlas used for a strain
+        """
+        return AtlasRegistry.get_atlas_version(
+            self.get_atlas_folder(), self.get_atlas_fname(strain_type)
+        )
+
     @staticmethod
     def t_max_to_dt(t_max, nt):
         dt = t_max / nt
@@ -116,9 +666,48 @@ class WormfunconnToPlot:
         t_max = dt * nt
         return t_max
 
+    @classmethod
+    def get_neuron_ids_from_db(cls, strain_type):
+        """
+        get the stimulable neuron ids of a strain from the database (see load_strains command),
+        in the order of the atlas; empty if the strain was not loaded or was loaded from
+        another version of its atlas
+        """
+        if strain_type not in wfc.strains:
+            strain_type = "wild-type"
+        atlas_version = AtlasRegistry.get_atlas_version(
+            cls.get_atlas_folder(), cls.get_atlas_fname(strain_type)
+        )
+        if atlas_version is None:
+            return []
+        try:
+            neuron_id_list = list(
+                StrainNeuron.objects.filter(
+                    strain__name=strain_type,
+                    strain__atlas_sha256=atlas_version,
+                    stimulable=True,
+                )
+                .order_by("position")
+                .values_list("neuron__name", flat=True)
+            )
+        except DatabaseError:
+            # e.g. database not migrated yet
+            neuron_id_list = []
+        return neuron_id_list
+
     def get_neuron_ids(self, strain_type):
+        """
+        get the stimulable neuron ids of a strain, from the database if the strain was loaded
+        there, otherwise from the strain's atlas
+        """
         self.strain_type = strain_type
+        with self.timer.stage("neuron_ids"):
+            neuron_id_list = self.get_neuron_ids_from_db(strain_type)
+        self.timer.cache_result("neuron_db", bool(neuron_id_list))
+        if neuron_id_list:
+            return neuron_id_list, {}
         funatlas, app_error_dict = self.get_funatlas(strain_type)
+        neuron_id_list = []
         if funatlas:
             try:
                 neuron_id_list = funatlas.get_neuron_ids(stim=True)
@@ -127,6 +716,37 @@ class WormfunconnToPlot:
                 app_error_dict["get_neuron_ids_error"] = e
         return neuron_id_list, app_error_dict
 
+    @classmethod
+    def get_neuron_ids_by_strain(cls):
+        """
+        get the stimulable neuron ids of every strain in wfc.strains, as {strain_type: [neu_id]}
+        the lists are computed once per process
+        """
+        app_error_dict = {}
+        if cls._neuron_ids_by_strain is None:
+            neuron_ids_by_strain = {}
+            for strain_type in wfc.strains:
+                neuron_ids, strain_error_dict = cls().get_neuron_ids(strain_type)
+                neuron_ids_by_strain[strain_type] = [
+                    str(neu_id) for neu_id in neuron_ids
+                ]
+                app_error_dict.update(strain_error_dict)
+            if app_error_dict:
+                return neuron_ids_by_strain, app_error_dict
+            cls._neuron_ids_by_strain = neuron_ids_by_strain
+        return cls._neuron_ids_by_strain, app_error_dict
+
+    @classmethod
+    def get_plot_cache_prefix(cls):
+        """
+        cache key prefix for AllOutput, which also depends on the decimation of the traces
+        """
+        return f"{cls.plot_cache_prefix}-{settings.PLOT_MAX_POINTS_PER_TRACE}"
+
+    @classmethod
+    def clear_neuron_ids_by_strain(cls):
+        cls._neuron_ids_by_strain = None
+
     @staticmethod
     def resp_labels_to_dict(labels):
         """
@@ -195,68 +815,203 @@ class WormfunconnToPlot:
             app_error_dict["input_parameter_error"] = "input is not a dictionary."
         return reqd_params_dict, app_error_dict
 
+    @staticmethod
+    def get_canonical_params(reqd_params_dict):
+        """
+        normalize values of reqd_params_dict, so that the same parameters given as form values
+        (e.g. nt=1000, t_max=100.0) or as query string values (e.g. "1000", "100") are equal
+        the order of resp_neu_ids is kept as it is passed on to get_responses
+        """
+        canonical_params = {}
+        for key, value in reqd_params_dict.items():
+            if key in ["strain_type", "stim_type", "stim_neu_id"]:
+                canonical_params[key] = None if value is None else str(value)
+            elif key == "resp_neu_ids":
+                canonical_params[key] = [str(neu_id) for neu_id in value or []]
+            elif key == "nt":
+                canonical_params[key] = int(value)
+            elif key == "top_n":
+                if value is None or value == "None" or value == "":
+                    canonical_params[key] = None
+                else:
+                    canonical_params[key] = int(value)
+            else:
+                # t_max and kwargs of stim_types
+                canonical_params[key] = float(value)
+        return canonical_params
+
+    def get_params_key(self, reqd_params_dict, prefix):
+        """
+        get a content-addressed cache key for a set of required parameters:
+        a sha256 of the canonical parameters and the version of the strain's atlas
+        None is returned if the parameters or the atlas are not valid
+        """
+        try:
+            canonical_params = self.get_canonical_params(reqd_params_dict)
+        except (ValueError, TypeError):
+            return None
+        atlas_version = self.get_atlas_version(canonical_params["strain_type"])
+        if atlas_version is None:
+            return None
+        params_json = json.dumps(
+            {"params": canonical_params, "atlas_version": atlas_version},
+            sort_keys=True,
+        )
+        return prefix + ":" + hashlib.sha256(params_json.encode()).hexdigest()
+
+    def get_plot_cache_key(self, params_dict):
+        """
+        get the cache key of the output of get_all_output_for_plot for a set of form
+        parameters, None if the parameters or the atlas are not valid
+        """
+        try:
+            reqd_params_dict, app_error_dict = self.get_reqd_params_dict(params_dict)
+        except KeyError:
+            return None
+        if not reqd_params_dict or app_error_dict:
+            return None
+        return self.get_params_key(reqd_params_dict, self.get_plot_cache_prefix())
+
+    def has_cached_output(self, params_dict):
+        """
+        whether get_all_output_for_plot can get the output of a set of form parameters
+        without simulating: from the plot cache, or the responses from the simulation
+        cache or the result store
+        """
+        cache_key = self.get_plot_cache_key(params_dict)
+        if cache_key is None:
+            return False
+        if get_simulation_cache().has_key(cache_key):
+            return True
+        reqd_params_dict, app_error_dict = self.get_reqd_params_dict(params_dict)
+        resp_key = self.get_params_key(reqd_params_dict, "resp")
+        return get_simulation_cache().has_key(resp_key) or has_stored_result(resp_key)
+
+    def get_stimulus_template_key(self, reqd_params_dict):
+        """
+        get the key of the stimulus template of a set of parameters: all parameters except the
+        stimulated and responding neurons, plus the atlas version
+        """
+        template_params_dict = {
+            key: value
+            for key, value in reqd_params_dict.items()
+            if key not in ["stim_neu_id", "resp_neu_ids", "top_n"]
+        }
+        return self.get_params_key(template_params_dict, "peak")
+
     def get_resp_in_ndarray(self, params_dict):
+        """
+        get responses for a set of parameters, from the simulation cache if the same parameters
+        were simulated before with the same atlas
+        """
         self.params_dict = params_dict
-        app_error_dict = {}
         reqd_params_dict, app_error_dict = self.get_reqd_params_dict(params_dict)
+        cache_key = None
+        if reqd_params_dict:
+            cache_key = self.get_params_key(reqd_params_dict, "resp")
+        if cache_key is not None and not self.bypass_cache:
+            cached_resp = get_simulation_cache().get(cache_key)
+            self.timer.cache_result("resp", cached_resp is not None)
+            if cached_resp is not None:
+                resp, labels, confidences, msg = cached_resp
+                return resp, labels, confidences, msg, app_error_dict
+            # results computed by another process or before a restart
+            stored_resp = get_stored_result(cache_key)
+            self.timer.cache_result("store", stored_resp is not None)
+            if stored_resp is not None:
+                get_simulation_cache().set(cache_key, stored_resp)
+                resp, labels, confidences, msg = stored_resp
+                return resp, labels, confidences, msg, app_error_dict
+
+        resp, labels, confidences, msg, app_error_dict = self.simulate_resp_in_ndarray(
+            params_dict
+        )
+        # only successful simulations are cached
+        if cache_key is not None and app_error_dict == {} and resp.size > 0:
+            get_simulation_cache().set(cache_key, (resp, labels, confidences, msg))
+            store_result(cache_key, resp, labels, confidences, msg)
+        return resp, labels, confidences, msg, app_error_dict
+
+    def get_stimulus(self, funatlas, reqd_params_dict):
+        """
+        call get_standard_stimulus based on stim_type
+        output:
+            stim: stimulus waveform, empty if it could not be generated
+            app_error_dict: logged errors
+        """
+        app_error_dict = {}
+        stim_type = reqd_params_dict["stim_type"]
+        nt = int(reqd_params_dict["nt"])
+        t_max = float(reqd_params_dict["t_max"])
+        dt = self.t_max_to_dt(t_max, nt)
         stim = np.empty(0)
+        if stim_type not in self.get_stim_type_list():
+            return stim, app_error_dict
+        try:
+            stim_kwargs = {}
+            if stim_type == "rectangular":
+                stim_kwargs["duration"] = float(reqd_params_dict["duration"])
+            elif stim_type == "delta":
+                stim_kwargs["duration"] = dt
+            elif stim_type == "sinusoidal":
+                stim_kwargs["frequency"] = float(reqd_params_dict["frequency"])
+                stim_kwargs["phi0"] = float(reqd_params_dict["phi0"])
+            elif stim_type == "realistic":
+                stim_kwargs["tau1"] = float(reqd_params_dict["tau1"])
+                stim_kwargs["tau2"] = float(reqd_params_dict["tau2"])
+            # the waveform is the same for all neurons and strains, reuse it
+            stim_key = (stim_type, nt, dt, tuple(sorted(stim_kwargs.items())))
 
-        if reqd_params_dict:
-            # get required values for every stim_type first
-            strain_type = reqd_params_dict["strain_type"]
-            stim_type = reqd_params_dict["stim_type"]
-            nt = int(reqd_params_dict["nt"])
-            t_max = float(reqd_params_dict["t_max"])
-            dt = self.t_max_to_dt(t_max, nt)
-            stim_neu_id = reqd_params_dict["stim_neu_id"]
-            # resp_neu_ids
-            resp_neu_ids = reqd_params_dict["resp_neu_ids"]
-            if len(resp_neu_ids) == 0:
-                resp_neu_ids = None
-            # top_n
-            top_n = reqd_params_dict["top_n"]
-            if top_n is None or top_n == "None":
-                top_n = None
+            def create_stim():
+                return funatlas.get_standard_stimulus(
+                    nt, dt=dt, stim_type=stim_type, **stim_kwargs
+                )
+
+            if self.bypass_cache:
+                stim = create_stim()
             else:
-                top_n = int(top_n)
+                stim = stimulus_cache.get_or_create(stim_key, create_stim)
+        except Exception as e:
+            stim = np.empty(0)
+            app_error_dict["get_standard_stimulus_error"] = e
+        return stim, app_error_dict
 
-            if app_error_dict == {}:
-                # Create FunctionalAtlas instance from file
-                funatlas, app_error_dict = self.get_funatlas(strain_type)
+    @staticmethod
+    def get_resp_kwargs(reqd_params_dict):
+        """
+        get resp_neu_ids and top_n as expected by FunctionalAtlas.get_responses
+        """
+        # resp_neu_ids
+        resp_neu_ids = reqd_params_dict["resp_neu_ids"]
+        if resp_neu_ids is None or len(resp_neu_ids) == 0:
+            resp_neu_ids = None
+        # top_n
+        top_n = reqd_params_dict["top_n"]
+        if top_n is None or top_n == "None":
+            top_n = None
+        else:
+            top_n = int(top_n)
+        return resp_neu_ids, top_n
 
-            # call get_standard_stimulus based on stim_type
-            if funatlas:
-                try:
-                    if stim_type == "rectangular":
-                        duration = float(reqd_params_dict["duration"])
-                        stim = funatlas.get_standard_stimulus(
-                            nt, dt=dt, stim_type=stim_type, duration=duration
-                        )
-                    elif stim_type == "delta":
-                        stim = funatlas.get_standard_stimulus(
-                            nt, dt=dt, stim_type=stim_type, duration=dt
-                        )
-                    elif stim_type == "sinusoidal":
-                        frequency = float(reqd_params_dict["frequency"])
-                        phi0 = float(reqd_params_dict["phi0"])
-                        stim = funatlas.get_standard_stimulus(
-                            nt,
-                            dt=dt,
-                            stim_type=stim_type,
-                            frequency=frequency,
-                            phi0=phi0,
-                        )
-                    elif stim_type == "realistic":
-                        tau1 = float(reqd_params_dict["tau1"])
-                        tau2 = float(reqd_params_dict["tau2"])
-                        stim = funatlas.get_standard_stimulus(
-                            nt, dt=dt, stim_type=stim_type, tau1=tau1, tau2=tau2
-                        )
-                except Exception as e:
-                    stim = np.empty(0)
-                    app_error_dict["get_standard_stimulus_error"] = e
+    def get_responses_to_stimulus(self, funatlas, stim, reqd_params_dict):
+        """
+        call get_responses for a stimulus generated by get_stimulus
+        """
+        app_error_dict = {}
+        nt = int(reqd_params_dict["nt"])
+        t_max = float(reqd_params_dict["t_max"])
+        dt = self.t_max_to_dt(t_max, nt)
+        stim_neu_id = reqd_params_dict["stim_neu_id"]
+        resp_neu_ids, top_n = self.get_resp_kwargs(reqd_params_dict)
+
+        # for top_n requests, only simulate the top_n candidates of the peak amplitude index
+        if resp_neu_ids is None and top_n is not None and top_n > 0:
+            template_key = self.get_stimulus_template_key(reqd_params_dict)
+            if template_key is not None:
+                resp_neu_ids = PeakAmplitudeIndex.get_top_n_candidates(
+                    template_key, stim_neu_id, top_n
+                )
 
-        # Get response
         if stim_neu_id is not None and stim_neu_id != "" and stim.size > 0:
             try:
                 resp, labels, confidences, msg = funatlas.get_responses(
@@ -281,6 +1036,160 @@ class WormfunconnToPlot:
 
         return resp, labels, confidences, msg, app_error_dict
 
+    def simulate_resp_in_ndarray(self, params_dict):
+        SIMULATIONS_IN_PROGRESS.inc()
+        try:
+            return self._simulate_resp_in_ndarray(params_dict)
+        finally:
+            SIMULATIONS_IN_PROGRESS.dec()
+
+    def _simulate_resp_in_ndarray(self, params_dict):
+        self.params_dict = params_dict
+        app_error_dict = {}
+        reqd_params_dict, app_error_dict = self.get_reqd_params_dict(params_dict)
+        funatlas = None
+        stim = np.empty(0)
+
+        if reqd_params_dict:
+            if app_error_dict == {}:
+                # Get the shared FunctionalAtlas instance for the strain
+                funatlas, app_error_dict = self.get_funatlas(
+                    reqd_params_dict["strain_type"]
+                )
+            if funatlas:
+                with self.timer.stage("stimulus"):
+                    stim, stim_error_dict = self.get_stimulus(
+                        funatlas, reqd_params_dict
+                    )
+                app_error_dict.update(stim_error_dict)
+
+        # Get response
+        if stim.size > 0:
+            with self.timer.stage("responses"):
+                resp, labels, confidences, msg, resp_error_dict = (
+                    self.get_responses_to_stimulus(funatlas, stim, reqd_params_dict)
+                )
+            app_error_dict.update(resp_error_dict)
+        else:
+            resp = np.empty(0)
+            labels = []
+            confidences = None
+            msg = None
+
+        return resp, labels, confidences, msg, app_error_dict
+
+    def get_batch_resp_in_ndarray(self, params_dict, stim_neu_ids):
+        """
+        get responses to each of several stimulated neurons, all other parameters being the same
+        the atlas and the stimulus are shared by all neurons, and each neuron's result goes
+        through the simulation cache like get_resp_in_ndarray
+        output:
+            list of (resp, labels, confidences, msg, app_error_dict), in the order of stim_neu_ids
+        """
+        self.params_dict = params_dict
+        reqd_params_dict, app_error_dict = self.get_reqd_params_dict(params_dict)
+        if not reqd_params_dict:
+            return [(np.empty(0), [], None, None, app_error_dict) for _ in stim_neu_ids]
+
+        funatlas = None
+        stim = None
+        results = []
+        for stim_neu_id in stim_neu_ids:
+            neu_params_dict = {**reqd_params_dict, "stim_neu_id": stim_neu_id}
+            cache_key = self.get_params_key(neu_params_dict, "resp")
+            cached_resp = None
+            if cache_key is not None:
+                cached_resp = get_simulation_cache().get(cache_key)
+            if cached_resp is None and cache_key is not None:
+                cached_resp = get_stored_result(cache_key)
+                if cached_resp is not None:
+                    get_simulation_cache().set(cache_key, cached_resp)
+            if cached_resp is not None:
+                results.append((*cached_resp, {}))
+                continue
+
+            # the atlas and stimulus are only needed on a cache miss, get them once
+            if stim is None:
+                funatlas, app_error_dict = self.get_funatlas(
+                    reqd_params_dict["strain_type"]
+                )
+                stim = np.empty(0)
+                if funatlas:
+                    stim, app_error_dict = self.get_stimulus(funatlas, reqd_params_dict)
+            if stim.size == 0:
+                results.append((np.empty(0), [], None, None, dict(app_error_dict)))
+                continue
+
+            resp, labels, confidences, msg, resp_error_dict = (
+                self.get_responses_to_stimulus(funatlas, stim, neu_params_dict)
+            )
+            if cache_key is not None and resp_error_dict == {} and resp.size > 0:
+                get_simulation_cache().set(cache_key, (resp, labels, confidences, msg))
+                store_result(cache_key, resp, labels, confidences, msg)
+            results.append((resp, labels, confidences, msg, resp_error_dict))
+        return results
+
+    def get_plot_figure(self, params_dict, resp, labels, confidences):
+        """
+        build the plotly figure (data and layout) of the neural responses of get_resp_in_ndarray
+        """
+        nt = int(params_dict["nt"])
+        t_max = float(params_dict["t_max"])
+        dt = self.t_max_to_dt(t_max, nt)
+
+        # create colormap for n colors
+        n_colors = len(labels)
+        if n_colors >= 2:
+            colors = px.colors.sample_colorscale(
+                "rainbow", [n / (n_colors - 1) for n in range(n_colors)]
+            )
+        else:
+            colors = ["rgb(255, 0, 0)"]
+
+        stim_neu_id = params_dict["stim_neu_id"]
+        # transposed array for response datasets
+        y_data_set = resp.T
+        x_data = np.arange(nt) * dt
+        # large nt: only send the samples visible at the plot's resolution
+        kept_indices = get_min_max_indices(resp, settings.PLOT_MAX_POINTS_PER_TRACE)
+        graphs = []
+        for i in range(len(labels)):
+            y_data = y_data_set[..., i]
+            x_data_i = x_data
+            if kept_indices is not None:
+                x_data_i = x_data[kept_indices[i]]
+                y_data = y_data[kept_indices[i]]
+            # adding scatter plot of each set of y_data vs. x_data
+            # plot trace: dish line for stimulated neuron; solid line for other selected neurons
+            resp_neu_id = labels[i].split()[0]
+            if resp_neu_id == stim_neu_id:
+                line_attr_dict = dict(dash="dash", color=colors[i], width=6)
+            else:
+                line_attr_dict = dict(dash="solid", color=colors[i], width=4)
+            graphs.append(
+                go.Scatter(
+                    x=x_data_i,
+                    y=y_data,
+                    mode="lines",
+                    line=line_attr_dict,
+                    opacity=confidences[i],
+                    name=labels[i],
+                    hovertemplate="(%{x},%{y})",
+                )
+            )
+
+        # layout of the figure.
+        layout = {
+            "title": f"Plot: Neural Responses to Stimulated Neuron ({stim_neu_id})",
+            "xaxis_title": "Time (s)",
+            "yaxis_title": "Neural Response",
+            "legend_title_text": "Responding Neuron (rank)",
+            "showlegend": True,
+            "height": 800,
+            "width": 1200,
+        }
+        return {"data": graphs, "layout": layout}
+
     def get_plot_html_div(self, params_dict):
         """
         convert and verify values for plotting neural responses using plotly
@@ -294,9 +1203,6 @@ class WormfunconnToPlot:
         https://plotly.com/python/figure-labels/
         """
         self.params_dict = params_dict
-        nt = int(params_dict["nt"])
-        t_max = float(params_dict["t_max"])
-        dt = self.t_max_to_dt(t_max, nt)
 
         # get response related output
         resp, labels, confidences, msg, app_error_dict = self.get_resp_in_ndarray(
@@ -308,52 +1214,9 @@ class WormfunconnToPlot:
         if msg is not None and msg != "":
             resp_msg = "Notes:\n" + msg
 
-        # create colormap for n colors
-        n_colors = len(labels)
-        if n_colors >= 2:
-            colors = px.colors.sample_colorscale(
-                "rainbow", [n / (n_colors - 1) for n in range(n_colors)]
-            )
-        else:
-            colors = ["rgb(255, 0, 0)"]
-
         if resp.size > 0:
-            stim_neu_id = params_dict["stim_neu_id"]
-            # transposed array for response datasets
-            y_data_set = resp.T
-            x_data = np.arange(nt) * dt
-            graphs = []
-            for i in range(len(labels)):
-                y_data = y_data_set[..., i]
-                # adding scatter plot of each set of y_data vs. x_data
-                # plot trace: dish line for stimulated neuron; solid line for other selected neurons
-                resp_neu_id = labels[i].split()[0]
-                if resp_neu_id == stim_neu_id:
-                    line_attr_dict = dict(dash="dash", color=colors[i], width=6)
-                else:
-                    line_attr_dict = dict(dash="solid", color=colors[i], width=4)
-                graphs.append(
-                    go.Scatter(
-                        x=x_data,
-                        y=y_data,
-                        mode="lines",
-                        line=line_attr_dict,
-                        opacity=confidences[i],
-                        name=labels[i],
-                        hovertemplate="(%{x},%{y})",
-                    )
-                )
-
-            # layout of the figure.
-            layout = {
-                "title": f"Plot: Neural Responses to Stimulated Neuron ({stim_neu_id})",
-                "xaxis_title": "Time (s)",
-                "yaxis_title": "Neural Response",
-                "legend_title_text": "Responding Neuron (rank)",
-                "showlegend": True,
-                "height": 800,
-                "width": 1200,
-            }
+            with self.timer.stage("figure"):
+                figure = self.get_plot_figure(params_dict, resp, labels, confidences)
 
             """
             Getting HTML needed to render the plot
@@ -363,10 +1226,17 @@ class WormfunconnToPlot:
                 validate (default=True): validate that all of the keys in the figure are valid
                 include_plotlyjs (default=True):
                 a script tag containing the plotly.js source code (~3MB) is included in the output.
+                It is set to False: the page loads plotly.js once from the versioned static file
+                (see get_plotlyjs_static_path), so plot_div only contains the figure JSON.
                 plot_div should have passed validations if no error raised
             """
             try:
-                plot_div = plot({"data": graphs, "layout": layout}, output_type="div")
+                with self.timer.stage("serialize"):
+                    plot_div = plot(
+                        figure,
+                        output_type="div",
+                        include_plotlyjs=False,
+                    )
             except Exception as e:
                 app_error_dict["plot_html_data_error"] = e
 
@@ -438,15 +1308,30 @@ class WormfunconnToPlot:
         self.params_dict = params_dict
         app_error_dict = {}
         # get required parameters and values first
-        reqd_params_dict, app_error_dict1 = self.get_reqd_params_dict(params_dict)
+        with self.timer.stage("params"):
+            reqd_params_dict, app_error_dict1 = self.get_reqd_params_dict(params_dict)
+        # repeat parameter sets skip both the simulation and the figure serialization
+        cache_key = None
+        if reqd_params_dict:
+            cache_key = self.get_params_key(
+                reqd_params_dict, self.get_plot_cache_prefix()
+            )
+        if cache_key is not None and not self.bypass_cache:
+            all_out = get_simulation_cache().get(cache_key)
+            self.timer.cache_result("plot", all_out is not None)
+            if all_out is not None:
+                return all_out._replace(stage_timings=self.timer.as_dict())
         # get plot_div
         plot_div, resp_msg, app_error_dict2 = self.get_plot_html_div(reqd_params_dict)
-        # get url_query_string for the plot
-        url_query_string, app_error_dict3 = self.get_url_query_string_for_plot(
-            reqd_params_dict
-        )
-        # get code snippet for the plot
-        code_snippet, app_error_dict4 = self.get_code_snippet_for_plot(reqd_params_dict)
+        with self.timer.stage("snippet"):
+            # get url_query_string for the plot
+            url_query_string, app_error_dict3 = self.get_url_query_string_for_plot(
+                reqd_params_dict
+            )
+            # get code snippet for the plot
+            code_snippet, app_error_dict4 = self.get_code_snippet_for_plot(
+                reqd_params_dict
+            )
         app_error_dict = {
             **app_error_dict1,
             **app_error_dict2,
@@ -454,11 +1339,15 @@ class WormfunconnToPlot:
             **app_error_dict4,
         }
         # all output in namedtuple
-        AllOutput = namedtuple(
-            "AllOutput",
-            "plot_div, resp_msg, url_query_string, code_snippet, app_error_dict",
-        )
         all_out = AllOutput(
-            plot_div, resp_msg, url_query_string, code_snippet, app_error_dict
+            plot_div,
+            resp_msg,
+            url_query_string,
+            code_snippet,
+            app_error_dict,
+            self.timer.as_dict(),
         )
+        # only complete output without errors is cached
+        if cache_key is not None and app_error_dict == {} and plot_div is not None:
+            get_simulation_cache().set(cache_key, all_out)
         return all_out
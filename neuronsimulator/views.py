@@ -1,30 +1,90 @@
-from django.http import JsonResponse
-from django.shortcuts import render
+import hashlib
+import io
+import json
+import logging
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from neuronsimulator.forms import ParamForm
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+from neuronsimulator.executor import (
+    SimulationPoolFull,
+    get_all_output_for_plot,
+    run_in_pool,
+)
+from neuronsimulator.export import iter_csv, iter_npy_bytes, iter_npz
+from neuronsimulator.forms import ParamForm, get_form_init_dict
+from neuronsimulator.jobs import expire_job, submit_job
+from neuronsimulator.metrics import render_metrics
+from neuronsimulator.models import SimulationJob
+from neuronsimulator.profiling import (
+    get_profile_path,
+    is_profile_request,
+    staff_profiling,
+)
+from neuronsimulator.timing import StageTimer
+from neuronsimulator.utils import AllOutput
 from neuronsimulator.utils import WormfunconnToPlot as wfc2plot
 
+# structured log lines of the stage timings of each request
+timing_logger = logging.getLogger("neuronsimulator.timing")
+
+# encodings of the simulate view
+SIMULATE_FORMATS = ["json", "npy", "f32"]
+# encodings of the simulate_batch view
+SIMULATE_BATCH_FORMATS = ["json", "npz"]
+# file formats of the export view
+EXPORT_FORMATS = ["csv", "npy", "npz"]
 
-def home(request):
 
-    context = {}
+def get_form_data_from_query(query_dict, form_init_dict):
+    """
+    convert a QueryDict (e.g. from url_for_plot) to form data, using initial values for missing fields
+    """
+    input_params_dict = dict(query_dict)
+    # value in list type, convert to string except for resp_neu_ids
+    for key, value in input_params_dict.items():
+        if key != "resp_neu_ids" and value != ["None"]:
+            input_params_dict.update({key: str(value[0])})
+        elif value == ["None"]:
+            input_params_dict[key] = None
+    # merge to get all form fields, input_params_dict have priority in terms of values
+    form_data_dict = {**form_init_dict, **input_params_dict}
+    return form_data_dict
+
+
+def get_home_form_context(request):
+    """
+    get the form and the page context without the simulation output
+    """
     form_init_dict = {}
     form_params = {}
-    plot_div = {}
-    resp_msg = ""
-    url_for_plot = ""
-    code_snippet = ""
-    app_error_dict = {}
     # form_opt_field_dict = {}
     form_opt_field_init_dict = {}
 
     # get initial values for all form fields
-    my_form = ParamForm()
-    for k in my_form.fields.keys():
-        form_init_dict[k] = my_form[k].initial
+    form_init_dict = get_form_init_dict()
 
     # get initial values and associated stim_type for optional form fields
-    form_opt_field_dict = my_form.form_opt_field_dict
+    form_opt_field_dict = ParamForm.form_opt_field_dict
     for k, v in form_opt_field_dict.items():
         v2 = {k1: v1 for k1, v1 in v.items() if k1 in ["stim_type", "default"]}
         form_opt_field_init_dict[k] = v2
@@ -32,19 +92,17 @@ def home(request):
     # get the list of names for optional fields
     opt_field_names = list(form_opt_field_dict.keys())
 
+    # plotly.js is loaded by the page, plot_div only contains the figure
+    plotlyjs_path = wfc2plot.get_plotlyjs_static_path()
+
+    # neuron lists of all strains are embedded in the page for switching strains
+    neuron_ids_by_strain, neuron_error_dict = wfc2plot.get_neuron_ids_by_strain()
+
     # get form input from request
     if request.method == "POST":
         my_form = ParamForm(request.POST)
     elif request.method == "GET":
-        input_params_dict = dict(request.GET)
-        # value in list type, convert to string except for resp_neu_ids
-        for key, value in input_params_dict.items():
-            if key != "resp_neu_ids" and value != ["None"]:
-                input_params_dict.update({key: str(value[0])})
-            elif value == ["None"]:
-                input_params_dict[key] = None
-        # merge to get all form fields, input_params_dict have priority in terms of values
-        form_data_dict = {**form_init_dict, **input_params_dict}
+        form_data_dict = get_form_data_from_query(request.GET, form_init_dict)
         my_form = ParamForm(form_data_dict)
 
     # get form error dict
@@ -53,49 +111,653 @@ def home(request):
     # get form valid input values
     form_params = my_form.cleaned_data
 
+    if not my_form.is_valid():
+        # for invalid form, render valid form values in addition to form error(s)
+        my_form = ParamForm(form_params)
+
+    context = {
+        "form": my_form,
+        "form_opt_field_init_dict": form_opt_field_init_dict,
+        "opt_field_names": opt_field_names,
+        "form_errors": form_errors,
+        "plotlyjs_path": plotlyjs_path,
+        "neuron_ids_by_strain": neuron_ids_by_strain,
+    }
+    return my_form, context
+
+
+def get_plot_context(request, out):
+    """
+    get the page context of the output of get_all_output_for_plot
+    """
+    # get url for plot
+    url_for_plot = (
+        request.build_absolute_uri("/")[:-1]
+        + reverse("home")
+        + "?"
+        + out.url_query_string
+    )
+    return {
+        "app_error_dict": out.app_error_dict,
+        "resp_msg": out.resp_msg,
+        "plot_div": out.plot_div,
+        "url_for_plot": url_for_plot,
+        "code_snippet": out.code_snippet,
+    }
+
+
+def is_job_request(request, form_params):
+    """
+    whether to run the simulation as a background job (settings.SIMULATION_JOBS, or job=1):
+    only if there is a neuron to simulate and the output is not cached already
+    """
+    query_dict = request.POST if request.method == "POST" else request.GET
+    if not (settings.SIMULATION_JOBS or query_dict.get("job") in ["1", "true", "on"]):
+        return False
+    if not form_params.get("stim_neu_id"):
+        return False
+    return not wfc2plot().has_cached_output(form_params)
+
+
+def get_job_output(request, form_params):
+    """
+    get the output of the finished job given by the job_id parameter, if any and if it
+    simulated the same parameters as the request
+    """
+    job_id = request.GET.get("job_id")
+    if not job_id:
+        return None
+    try:
+        job = SimulationJob.objects.filter(id=job_id, status=SimulationJob.DONE).first()
+    except ValidationError:
+        return None
+    if job is None:
+        return None
+    w2p = wfc2plot()
+    job_key = w2p.get_plot_cache_key(job.params)
+    if job_key is None or job_key != w2p.get_plot_cache_key(form_params):
+        return None
+    return AllOutput(**job.result)
+
+
+def get_plot_page_etag(request, form_params):
+    """
+    get a weak ETag of the page of a plot url (GET with valid parameters), from the canonical
+    parameters and atlas version of the plot plus the other inputs of the page: the plot
+    cache prefix (bumped when the output changes), plotly.js, the neuron lists and the CSRF
+    cookie of the form; None for requests which are not cacheable (jobs, profiling) and
+    for pages with an unknown atlas version or neuron list errors
+    """
+    query_keys = set(request.GET.keys())
+    if request.method != "GET" or query_keys & {"job", "job_id", "profile"}:
+        return None
+    w2p = wfc2plot()
+    reqd_params_dict, app_error_dict = w2p.get_reqd_params_dict(form_params)
+    if not reqd_params_dict or app_error_dict:
+        return None
+    params_key = w2p.get_params_key(reqd_params_dict, wfc2plot.get_plot_cache_prefix())
+    neuron_list_etag = get_neuron_list_etag(request)
+    if params_key is None or neuron_list_etag is None:
+        return None
+    page_inputs = [
+        params_key,
+        wfc2plot.get_plotlyjs_static_path(),
+        neuron_list_etag,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+    ]
+    digest = hashlib.sha256("\n".join(page_inputs).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def add_plot_page_cache_headers(response, etag):
+    """
+    let the browser reuse and revalidate a plot page; the page embeds the CSRF token of the
+    user (and may set its cookie), so shared caches must never store it
+    """
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=settings.PLOT_PAGE_MAX_AGE)
+    # the page has the CSRF token of the cookie, also for 304 responses
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def get_plot_page_not_modified(request, my_form):
+    """
+    get the ETag of a plot page and a 304 response if the client already has it
+    """
+    etag = None
     if my_form.is_valid():
-        # get all output for neural response plot, and write error(s) to app_error_dict
-        out = wfc2plot().get_all_output_for_plot(form_params)
-        plot_div = out.plot_div
-        resp_msg = out.resp_msg
-        code_snippet = out.code_snippet
-        app_error_dict = out.app_error_dict
-
-        # get url for plot
-        url_for_plot = (
-            request.build_absolute_uri("/")[:-1]
-            + reverse("home")
-            + "?"
-            + out.url_query_string
-        )
+        etag = get_plot_page_etag(request, my_form.cleaned_data)
+    if etag is None:
+        return None, None
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        add_plot_page_cache_headers(not_modified, etag)
+    return etag, not_modified
 
+
+@staff_profiling("home")
+def home(request):
+    timer = StageTimer()
+    # profiled requests do the work of a first request, not a cache hit
+    bypass_cache = is_profile_request(request)
+    with timer.stage("form"):
+        my_form, context = get_home_form_context(request)
+    # repeat views of a plot url are validated without simulating or rendering
+    etag, not_modified = get_plot_page_not_modified(request, my_form)
+    if not_modified is not None and not bypass_cache:
+        return timer.add_to_response(not_modified, timing_logger, "home")
+
+    if my_form.is_valid():
+        out = get_job_output(request, my_form.cleaned_data)
+        if out is None and is_job_request(request, my_form.cleaned_data):
+            job = submit_job(my_form.cleaned_data)
+            return redirect("job", job_id=job.id)
+        if out is None:
+            # get all output for neural response plot, and write error(s) to app_error_dict
+            out = wfc2plot(bypass_cache=bypass_cache).get_all_output_for_plot(
+                my_form.cleaned_data
+            )
+        timer.update(out.stage_timings)
         # add all output to context
-        context = {
-            "form": my_form,
-            "form_opt_field_init_dict": form_opt_field_init_dict,
-            "opt_field_names": opt_field_names,
-            "form_errors": form_errors,
-            "app_error_dict": app_error_dict,
-            "resp_msg": resp_msg,
-            "plot_div": plot_div,
-            "url_for_plot": url_for_plot,
-            "code_snippet": code_snippet,
-        }
-    else:
-        # for invalid form, render valid form values in addition to form error(s)
-        my_form = ParamForm(form_params)
-        context = {
-            "form": my_form,
-            "form_opt_field_init_dict": form_opt_field_init_dict,
-            "opt_field_names": opt_field_names,
-            "form_errors": form_errors,
-        }
+        context.update(get_plot_context(request, out))
+        # only complete output can be cached
+        if out.app_error_dict or out.plot_div is None:
+            etag = None
+
+    with timer.stage("render"):
+        response = render(request, "home.html", context)
+    if etag is not None:
+        add_plot_page_cache_headers(response, etag)
+    return timer.add_to_response(response, timing_logger, "home")
+
+
+async def home_async(request):
+    """
+    same as home, but the simulation and the figure run in the simulation pool (see
+    executor.py) so that the server keeps serving other requests meanwhile; the form,
+    database and template work runs in the sync thread
+    """
+    if await sync_to_async(is_profile_request)(request):
+        # profile the whole request in this process, including the simulation
+        return await sync_to_async(home)(request)
+    timer = StageTimer()
+    with timer.stage("form"):
+        my_form, context = await sync_to_async(get_home_form_context)(request)
+    etag, not_modified = await sync_to_async(get_plot_page_not_modified)(
+        request, my_form
+    )
+    if not_modified is not None:
+        return timer.add_to_response(not_modified, timing_logger, "home_async")
+    status = 200
+
+    if my_form.is_valid():
+        out = await sync_to_async(get_job_output)(request, my_form.cleaned_data)
+        if out is None and await sync_to_async(is_job_request)(
+            request, my_form.cleaned_data
+        ):
+            job = await sync_to_async(submit_job)(my_form.cleaned_data)
+            return redirect("job", job_id=job.id)
+        try:
+            if out is None:
+                with timer.stage("pool"):
+                    out = await run_in_pool(
+                        get_all_output_for_plot, my_form.cleaned_data
+                    )
+            timer.update(out.stage_timings)
+            context.update(get_plot_context(request, out))
+            if out.app_error_dict or out.plot_div is None:
+                etag = None
+        except SimulationPoolFull:
+            etag = None
+            context["app_error_dict"] = {
+                "busy": "Too many simulations in progress, please try again shortly"
+            }
+            status = 503
+
+    with timer.stage("render"):
+        response = await sync_to_async(render)(
+            request, "home.html", context, status=status
+        )
+    if status == 503:
+        response["Retry-After"] = str(settings.SIMULATION_RETRY_AFTER)
+    elif etag is not None:
+        add_plot_page_cache_headers(response, etag)
+    return timer.add_to_response(response, timing_logger, "home_async")
+
+
+@staff_member_required
+def profile_download(request, fname):
+    """
+    download a profile or report saved by staff_profiling
+    """
+    path = get_profile_path(fname)
+    if path is None:
+        raise Http404("Profile not found")
+    return FileResponse(open(path, "rb"), as_attachment=fname.endswith(".prof"))
+
+
+def job(request, job_id):
+    """
+    page of a simulation job: refreshes while the job is pending, redirects to the plot
+    when it is done
+    """
+    job = get_object_or_404(SimulationJob, id=job_id)
+    expire_job(job)
+    if job.status == SimulationJob.DONE:
+        return redirect(get_job_url(job))
+    return render(
+        request,
+        "job.html",
+        {"job": job, "refresh_seconds": settings.SIMULATION_JOB_REFRESH},
+    )
+
+
+def get_job_url(job):
+    return f"{reverse('home')}?{job.result['url_query_string']}&job_id={job.id}"
+
+
+def job_status(request, job_id):
+    """
+    status of a simulation job as JSON, with the url of the plot once done
+    """
+    job = get_object_or_404(SimulationJob, id=job_id)
+    expire_job(job)
+    response_data = {"id": str(job.id), "status": job.status}
+    if job.status == SimulationJob.DONE:
+        response_data["url"] = request.build_absolute_uri(get_job_url(job))
+    elif job.status == SimulationJob.FAILED:
+        response_data["error"] = job.error
+    return JsonResponse(response_data)
+
+
+def get_neuron_list_etag(request):
+    neuron_ids_by_strain, app_error_dict = wfc2plot.get_neuron_ids_by_strain()
+    # lists with errors get no ETag, so they are never validated as current
+    if app_error_dict:
+        return None
+    neuron_list_json = json.dumps(neuron_ids_by_strain, sort_keys=True)
+    return hashlib.sha256(neuron_list_json.encode()).hexdigest()
+
+
+@condition(etag_func=get_neuron_list_etag)
+def neurons(request):
+    """
+    neuron lists of all strains in one response, as {"strains": {strain_type: [neu_id]}}
+    the lists only change with the atlases, so successful responses carry an ETag and
+    Cache-Control; errors are not stored by caches
+    """
+    neuron_ids_by_strain, app_error_dict = wfc2plot.get_neuron_ids_by_strain()
+    response_data = {"strains": neuron_ids_by_strain}
+    if app_error_dict:
+        response_data["errors"] = {k: [str(v)] for k, v in app_error_dict.items()}
+        response = JsonResponse(response_data, status=500)
+        patch_cache_control(response, no_store=True)
+        return response
+    response = JsonResponse(response_data)
+    patch_cache_control(response, public=True, max_age=settings.NEURON_LIST_MAX_AGE)
+    return response
 
-    return render(request, "home.html", context)
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    metrics of this server process in Prometheus text format, for requests with the bearer
+    token settings.METRICS_TOKEN; not found if no token is set
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404()
+    scheme, sep, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not constant_time_compare(
+        token.strip(), settings.METRICS_TOKEN
+    ):
+        response = HttpResponse(status=401)
+        response["WWW-Authenticate"] = "Bearer"
+        return response
+    response = HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+    patch_cache_control(response, no_store=True)
+    return response
 
 
 def load_neurons(request):
+    timer = StageTimer()
     strain_type = request.GET.get("strain_type")
-    neuron_ids, app_error_dict = wfc2plot().get_neuron_ids(strain_type)
+    neuron_ids, app_error_dict = wfc2plot(timer=timer).get_neuron_ids(strain_type)
     response_data = {"neurons": neuron_ids}
-    return JsonResponse(response_data)
+    return timer.add_to_response(
+        JsonResponse(response_data), timing_logger, "load_neurons"
+    )
+
+
+def resp_to_float32_list(resp):
+    """
+    convert a response array to nested lists of floats rounded to float32 precision,
+    which keeps the JSON about half the size of full float64 values
+    """
+    return np.asarray(resp, dtype=np.float32).astype(str).astype(np.float64).tolist()
+
+
+def get_resp_http_response(resp, labels, confidences, msg, dt, output_format):
+    """
+    encode simulated responses without HTML or plotly figure
+    output_format:
+        json: responses (float32 precision), labels, confidences, dt and msg as JSON
+        npy: responses as a little-endian float32 .npy file
+        f32: responses as raw little-endian float32 values, with the shape in the X-Shape header
+    for npy and f32 the labels, confidences and dt are sent in X-Labels, X-Confidences and X-Dt
+    """
+    labels = [str(label) for label in labels]
+    if confidences is not None:
+        confidences = [float(c) for c in confidences]
+    resp = np.asarray(resp, dtype="<f4")
+    if output_format == "json":
+        response_data = {
+            "shape": list(resp.shape),
+            "dt": dt,
+            "labels": labels,
+            "confidences": confidences,
+            "responses": resp_to_float32_list(resp),
+            "msg": msg,
+        }
+        return JsonResponse(response_data)
+
+    if output_format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, resp)
+        response = HttpResponse(
+            buffer.getvalue(), content_type="application/octet-stream"
+        )
+        response["Content-Disposition"] = 'attachment; filename="responses.npy"'
+    else:
+        response = HttpResponse(resp.tobytes(), content_type="application/octet-stream")
+        response["X-Dtype"] = resp.dtype.str
+        response["X-Shape"] = ",".join(str(n) for n in resp.shape)
+    response["X-Dt"] = str(dt)
+    response["X-Labels"] = json.dumps(labels)
+    response["X-Confidences"] = json.dumps(confidences)
+    return response
+
+
+def get_simulation_request(query_dict, formats):
+    """
+    validate the ParamForm parameters and the format (one of formats, the first is the default)
+    of a simulate or export request; missing parameters take the form's initial values
+    return form_params, output_format and an error response (None if valid)
+    """
+    output_format = query_dict.get("format", formats[0])
+    if output_format not in formats:
+        return (
+            None,
+            output_format,
+            JsonResponse(
+                {"errors": {"format": [f"expected one of {', '.join(formats)}"]}},
+                status=400,
+            ),
+        )
+    form_data_dict = get_form_data_from_query(query_dict, get_form_init_dict())
+    form_data_dict.pop("format", None)
+    my_form = ParamForm(form_data_dict)
+    if not my_form.is_valid():
+        return (
+            None,
+            output_format,
+            JsonResponse({"errors": my_form.errors.get_json_data()}, status=400),
+        )
+    form_params = my_form.cleaned_data
+    if not form_params["stim_neu_id"]:
+        return (
+            None,
+            output_format,
+            JsonResponse(
+                {"errors": {"stim_neu_id": ["a stimulated neuron is required"]}},
+                status=400,
+            ),
+        )
+    return form_params, output_format, None
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def simulate(request):
+    """
+    return simulated responses for ParamForm parameters (same as url_for_plot) without rendering
+    a page; missing parameters take the form's initial values
+    the encoding is selected with format=json (default), npy or f32
+    """
+    query_dict = request.POST if request.method == "POST" else request.GET
+    form_params, output_format, error_response = get_simulation_request(
+        query_dict, SIMULATE_FORMATS
+    )
+    if error_response is not None:
+        return error_response
+
+    resp, labels, confidences, msg, app_error_dict = wfc2plot().get_resp_in_ndarray(
+        form_params
+    )
+    if app_error_dict:
+        return JsonResponse(
+            {"errors": {k: [str(v)] for k, v in app_error_dict.items()}}, status=400
+        )
+    dt = wfc2plot.t_max_to_dt(form_params["t_max"], form_params["nt"])
+    return get_resp_http_response(resp, labels, confidences, msg, dt, output_format)
+
+
+@require_http_methods(["GET"])
+def export(request):
+    """
+    download simulated responses for ParamForm parameters (same as url_for_plot) as a
+    streamed file (csv in chunks of time steps, npy and npz in chunks of bytes), selected
+    with format=
+        csv (default): a "time" + labels header row, a "confidence" row, one row per time step
+        npy: responses as a little-endian float32 .npy file (neurons x time steps), with the
+        labels, confidences and dt in the X-Labels, X-Confidences and X-Dt headers
+        npz: uncompressed .npz with arrays resp (float32), t, labels and confidences
+    """
+    form_params, output_format, error_response = get_simulation_request(
+        request.GET, EXPORT_FORMATS
+    )
+    if error_response is not None:
+        return error_response
+
+    resp, labels, confidences, msg, app_error_dict = wfc2plot().get_resp_in_ndarray(
+        form_params
+    )
+    if app_error_dict:
+        return JsonResponse(
+            {"errors": {k: [str(v)] for k, v in app_error_dict.items()}}, status=400
+        )
+    dt = wfc2plot.t_max_to_dt(form_params["t_max"], form_params["nt"])
+    resp = np.asarray(resp, dtype="<f4")
+    t = np.arange(resp.shape[-1]) * dt
+    labels = [str(label) for label in labels]
+    filename = f"responses_{form_params['strain_type']}_{form_params['stim_neu_id']}"
+
+    if output_format == "csv":
+        streaming_content = iter_csv(resp, t, labels, confidences)
+        content_type = "text/csv"
+    elif output_format == "npy":
+        streaming_content = iter_npy_bytes(resp)
+        content_type = "application/octet-stream"
+    else:
+        arrays = {
+            "resp": resp,
+            "t": t.astype("<f8"),
+            "labels": np.array(labels, dtype=str),
+            "confidences": np.asarray(
+                [] if confidences is None else confidences, dtype="<f4"
+            ),
+        }
+        streaming_content = iter_npz(arrays)
+        content_type = "application/octet-stream"
+    response = StreamingHttpResponse(streaming_content, content_type=content_type)
+    response["Content-Disposition"] = (
+        f'attachment; filename="{filename}.{output_format}"'
+    )
+    if output_format == "npy":
+        response["X-Dt"] = str(dt)
+        response["X-Labels"] = json.dumps(labels)
+        response["X-Confidences"] = json.dumps(
+            None if confidences is None else [float(c) for c in confidences]
+        )
+    return response
+
+
+def get_batch_http_response(stim_neu_ids, results, dt_list, output_format):
+    """
+    encode the results of a batch simulation in one payload
+    output_format:
+        json: list of results with responses rounded to float32 precision
+        npz: uncompressed .npz with little-endian float32 arrays resp_<i> and arrays labels_<i>,
+        confidences_<i> for the i-th result, plus stim_neu_ids, dt and errors (JSON per result)
+    """
+    if output_format == "json":
+        response_list = []
+        for stim_neu_id, result, dt in zip(stim_neu_ids, results, dt_list):
+            resp, labels, confidences, msg, app_error_dict = result
+            response_list.append(
+                {
+                    "stim_neu_id": stim_neu_id,
+                    "shape": list(np.shape(resp)),
+                    "dt": dt,
+                    "labels": [str(label) for label in labels],
+                    "confidences": (
+                        None if confidences is None else [float(c) for c in confidences]
+                    ),
+                    "responses": resp_to_float32_list(resp),
+                    "msg": msg,
+                    "errors": {k: [str(v)] for k, v in app_error_dict.items()},
+                }
+            )
+        return JsonResponse({"results": response_list})
+
+    arrays = {
+        "stim_neu_ids": np.array(stim_neu_ids, dtype=str),
+        "dt": np.array(dt_list, dtype="<f8"),
+        "errors": np.array(
+            [
+                json.dumps({k: [str(v)] for k, v in result[4].items()})
+                for result in results
+            ],
+            dtype=str,
+        ),
+    }
+    for i, result in enumerate(results):
+        resp, labels, confidences, msg, app_error_dict = result
+        arrays[f"resp_{i}"] = np.asarray(resp, dtype="<f4")
+        arrays[f"labels_{i}"] = np.array([str(label) for label in labels], dtype=str)
+        arrays[f"confidences_{i}"] = np.asarray(
+            [] if confidences is None else confidences, dtype="<f4"
+        )
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    response = HttpResponse(buffer.getvalue(), content_type="application/octet-stream")
+    response["Content-Disposition"] = 'attachment; filename="responses.npz"'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def simulate_batch(request):
+    """
+    simulate many parameter sets in one request; the JSON request body is either
+        {"params": {...}, "stim_neu_ids": ["FLPL", ...] or "all", "format": "json"}
+    to stimulate each neuron with the same stimulus and parameters, or
+        {"param_sets": [{...}, {...}], "format": "npz"}
+    for independent parameter sets. Parameters are those of ParamForm; missing ones take
+    the form's initial values.
+    """
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"errors": {"body": ["invalid JSON"]}}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse(
+            {"errors": {"body": ["expected a JSON object"]}}, status=400
+        )
+
+    output_format = body.get("format", "json")
+    if output_format not in SIMULATE_BATCH_FORMATS:
+        return JsonResponse(
+            {
+                "errors": {
+                    "format": [f"expected one of {', '.join(SIMULATE_BATCH_FORMATS)}"]
+                }
+            },
+            status=400,
+        )
+    form_init_dict = get_form_init_dict()
+    max_size = settings.SIMULATE_BATCH_MAX_SIZE
+
+    if "param_sets" in body:
+        param_sets = body["param_sets"]
+        if not isinstance(param_sets, list) or len(param_sets) > max_size:
+            return JsonResponse(
+                {"errors": {"param_sets": [f"expected a list of at most {max_size}"]}},
+                status=400,
+            )
+        form_params_list = []
+        for i, params in enumerate(param_sets):
+            if not isinstance(params, dict):
+                return JsonResponse(
+                    {"errors": {f"param_sets[{i}]": ["expected a JSON object"]}},
+                    status=400,
+                )
+            my_form = ParamForm({**form_init_dict, **params})
+            if not my_form.is_valid():
+                return JsonResponse(
+                    {"errors": {f"param_sets[{i}]": my_form.errors.get_json_data()}},
+                    status=400,
+                )
+            form_params_list.append(my_form.cleaned_data)
+        stim_neu_ids = [form_params["stim_neu_id"] for form_params in form_params_list]
+        results = []
+        for form_params in form_params_list:
+            # each result already carries its own app_error_dict
+            results.append(wfc2plot().get_resp_in_ndarray(form_params))
+    else:
+        params = body.get("params", {})
+        stim_neu_ids = body.get("stim_neu_ids")
+        if not isinstance(params, dict):
+            return JsonResponse(
+                {"errors": {"params": ["expected a JSON object"]}}, status=400
+            )
+        my_form = ParamForm({**form_init_dict, **params, "stim_neu_id": ""})
+        if not my_form.is_valid():
+            return JsonResponse({"errors": my_form.errors.get_json_data()}, status=400)
+        form_params = my_form.cleaned_data
+        valid_neu_ids = [choice[0] for choice in my_form.fields["stim_neu_id"].choices]
+        if stim_neu_ids == "all":
+            stim_neu_ids = valid_neu_ids
+        if (
+            not isinstance(stim_neu_ids, list)
+            or len(stim_neu_ids) == 0
+            or len(stim_neu_ids) > max_size
+        ):
+            return JsonResponse(
+                {
+                    "errors": {
+                        "stim_neu_ids": [
+                            f'expected "all" or a list of 1 to {max_size} neurons'
+                        ]
+                    }
+                },
+                status=400,
+            )
+        invalid_neu_ids = [
+            neu_id for neu_id in stim_neu_ids if neu_id not in valid_neu_ids
+        ]
+        if invalid_neu_ids:
+            return JsonResponse(
+                {"errors": {"stim_neu_ids": [f"invalid neurons: {invalid_neu_ids}"]}},
+                status=400,
+            )
+        results = wfc2plot().get_batch_resp_in_ndarray(form_params, stim_neu_ids)
+        form_params_list = [form_params] * len(stim_neu_ids)
+
+    dt_list = [
+        wfc2plot.t_max_to_dt(form_params["t_max"], form_params["nt"])
+        for form_params in form_params_list
+    ]
+    return get_batch_http_response(stim_neu_ids, results, dt_list, output_format)